@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, NamedTuple, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gis-anomaly-detector")
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+    content_type: Optional[str] = None
+
+
+class ResponseCache:
+    """On-disk store of response bodies and their ETags, for revalidating with ``If-None-Match``.
+
+    Each entry is one file holding a JSON header line followed by the body. Once the directory grows past
+    ``max_bytes``, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self._directory = directory
+        self._max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, params: Dict[str, Any], accept: str = "") -> str:
+        # Representations negotiated through Accept are separate entries, matching the server's Vary header.
+        return hashlib.sha256(json.dumps([url, sorted(params.items()), accept], default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.entry")
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            with open(self._path(key), "rb") as file:
+                header = json.loads(file.readline())
+                body = file.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+        os.utime(self._path(key))
+        return CachedResponse(header["etag"], body, header.get("content_type"))
+
+    def put(self, key: str, etag: str, body: bytes, content_type: Optional[str] = None) -> None:
+        # Written to a temporary file and renamed, so concurrent readers never see a partial entry.
+        descriptor, temporary = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(json.dumps({"etag": etag, "content_type": content_type}).encode() + b"\n")
+            file.write(body)
+        os.replace(temporary, self._path(key))
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".entry"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
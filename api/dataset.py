@@ -1,46 +1,326 @@
+import asyncio
 import json
 from types import NoneType
 
+import httpx
 import requests
-from typing import Union, Dict, List
+from requests.adapters import HTTPAdapter
+from typing import Union, Dict, List, Iterator, Optional, Tuple, Any, TYPE_CHECKING
 from pandas import Series
+from urllib3.util.retry import Retry
+
+from api.cache import ResponseCache, CachedResponse, DEFAULT_CACHE_DIR
+from api.frames import frame_accept, read_frame
+
+# geopandas and pyarrow are only needed by the *_frame methods.
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+# (connect, read) seconds; reads are long because a cold /anomaly downloads and scores a whole city.
+DEFAULT_TIMEOUT = (5.0, 300.0)
+# Overload responses from admission control, plus transient proxy errors.
+RETRY_STATUSES = (429, 502, 503, 504)
+# Longest Retry-After honoured between attempts, so a server cannot stall the client indefinitely.
+MAX_RETRY_AFTER = 60.0
+
+
+def _anomaly_params(location: str, deadline: Optional[float]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"city": location}
+    if deadline is not None:
+        # The server may skip the LLM or sample amenities to answer in time; see the X-Degradations header.
+        params["deadline"] = deadline
+    return params
+
+
+def _anomaly_features(raw: Any) -> List[Dict]:
+    # Older servers double-encoded the GeoJSON as a JSON string.
+    geojson = json.loads(raw) if isinstance(raw, str) else raw
+    return geojson.get("features", [])
+
+
+class _CappedRetry(Retry):
+    def __init__(self, *args: Any, max_retry_after: float = MAX_RETRY_AFTER, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs: Any) -> '_CappedRetry':
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response: Any) -> Optional[float]:
+        seconds = super().get_retry_after(response)
+        return min(seconds, self.max_retry_after) if seconds is not None else None
 
 
 class AnomalyDetectorConn:
-    def __init__(self, conn: str = "http://127.0.0.1:8000/") -> None:
+    """Client for the server's endpoints over one pooled ``requests`` session with timeouts and retries.
+
+    Idempotent requests are retried with exponential backoff on connection errors and on ``RETRY_STATUSES``,
+    honouring ``Retry-After`` up to ``max_retry_after`` seconds; once retries run out the error status is raised as
+    ``requests.HTTPError``. City and anomaly responses are cached in ``cache_dir`` (``None`` disables it) and
+    revalidated with their ETag, so an unchanged city costs a single 304 round trip.
+    """
+
+    def __init__(self, conn: str = "http://127.0.0.1:8000/", *,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = 3, backoff: float = 0.5,
+                 pool_size: int = 10, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_retry_after: float = MAX_RETRY_AFTER) -> None:
         self._connection = conn
+        self._timeout = timeout
+        self._cache = ResponseCache(cache_dir) if cache_dir is not None else None
+        # The last response is returned rather than raised as MaxRetryError, and callers raise it as an HTTPError.
+        retry = _CappedRetry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                             raise_on_status=False, max_retry_after=max_retry_after)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self._session.close()
+
+    def __enter__(self) -> 'AnomalyDetectorConn':
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def _get(self, path: str, **kwargs: Any) -> requests.Response:
+        return self._session.get(self._connection + path, timeout=self._timeout, **kwargs)
+
+    def _post(self, path: str, **kwargs: Any) -> requests.Response:
+        return self._session.post(self._connection + path, timeout=self._timeout, **kwargs)
+
+    def _get_json(self, path: str, params: Dict[str, Any]) -> Any:
+        response = self._get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def _get_cached(self, path: str, params: Dict[str, Any], accept: str = "") -> CachedResponse:
+        headers = {"Accept": accept} if accept else {}
+        key = ResponseCache.key(self._connection + path, params, accept)
+        cached = self._cache.get(key)
+        if cached is not None:
+            headers["If-None-Match"] = cached.etag
+
+        response = self._get(path, params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return cached
+
+        response.raise_for_status()
+        fresh = CachedResponse(response.headers.get("ETag"), response.content, response.headers.get("Content-Type"))
+        if response.status_code == 200 and fresh.etag is not None:
+            self._cache.put(key, fresh.etag, fresh.body, fresh.content_type)
+        return fresh
+
+    def _get_json_cached(self, path: str, params: Dict[str, Any]) -> Any:
+        if self._cache is None:
+            return self._get_json(path, params)
+
+        return json.loads(self._get_cached(path, params).body)
+
+    def _get_frame(self, path: str, params: Dict[str, Any], cached: bool = True) -> 'GeoDataFrame':
+        accept = frame_accept()
+        if cached and self._cache is not None:
+            entry = self._get_cached(path, params, accept)
+            return read_frame(entry.body, entry.content_type)
+
+        with self._get(path, params=params, headers={"Accept": accept}, stream=True) as response:
+            response.raise_for_status()
+            # Parsed straight off the socket, so the body is never held in memory as one string.
+            response.raw.decode_content = True
+            # Buffered readers call read() again after EOF, which fails once urllib3 has auto-closed the stream.
+            response.raw.auto_close = False
+            frame = read_frame(response.raw, response.headers.get("Content-Type"))
+            degradations = response.headers.get("X-Degradations")
+
+        if degradations is not None:
+            frame.attrs["degradations"] = [] if degradations == "none" else degradations.split(",")
+        return frame
 
     def connected(self) -> bool:
-        response = requests.get(self._connection)
+        response = self._get("")
         if response.status_code != 200:
             return False
 
         return response.json() == {"status": "API running"}
 
+    def get_pipeline_version(self) -> str:
+        """Changes when the server's detector, LLM or prompt does, invalidating results cached by clients."""
+        response = self._get("/version")
+        response.raise_for_status()
+
+        return response.json()["pipeline"]
+
     def get_city_data(self, city: str) -> Dict[str, Dict]:
-        response = requests.get(self._connection + "/osmnx", params={"city": city})
+        return self._get_json_cached("/osmnx", {"city": city})
 
-        return response.json()
+    def get_city_frame(self, city: str) -> 'GeoDataFrame':
+        """The city's OSM features as a GeoDataFrame, decoded from Arrow when the server and pyarrow allow."""
+        return self._get_frame("/osmnx", {"city": city})
 
-    def get_all_dataframes(self, city: str) -> Dict[str, Dict]:
-        response = requests.get(self._connection + "/debug", params={"city": city})
+    def iter_layer(self, city: str, layer: str, *, bbox: Optional[Tuple[float, float, float, float]] = None,
+                   columns: Optional[List[str]] = None, page_size: int = 1000) -> Iterator[Dict]:
+        params = {"city": city, "limit": page_size}
+        if bbox is not None:
+            params["bbox"] = ",".join(str(value) for value in bbox)
+        if columns is not None:
+            params["columns"] = ",".join(columns)
 
-        return response.json()
+        while True:
+            with self._get(f"/layers/{layer}", params=params, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+
+                next_cursor = response.headers.get("X-Next-Cursor")
+
+            if next_cursor is None:
+                return
+            params["cursor"] = next_cursor
+
+    def get_layer_frame(self, city: str, layer: str, *, bbox: Optional[Tuple[float, float, float, float]] = None,
+                        columns: Optional[List[str]] = None, page_size: int = 10000) -> 'GeoDataFrame':
+        """A whole export layer as one GeoDataFrame, paged as FlatGeobuf, or as NDJSON features without pyogrio."""
+        import pandas
+        from geopandas import GeoDataFrame
+
+        try:
+            import pyogrio
+        except ImportError:
+            return GeoDataFrame.from_features(self.iter_layer(city, layer, bbox=bbox, columns=columns,
+                                                              page_size=page_size), crs="EPSG:4326")
+
+        params = {"city": city, "limit": page_size, "format": "fgb"}
+        if bbox is not None:
+            params["bbox"] = ",".join(str(value) for value in bbox)
+        if columns is not None:
+            params["columns"] = ",".join(columns)
+
+        pages = []
+        while True:
+            response = self._get(f"/layers/{layer}", params=params)
+            response.raise_for_status()
+            pages.append(pyogrio.read_dataframe(response.content))
+
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if next_cursor is None:
+                return GeoDataFrame(pandas.concat(pages, ignore_index=True), crs=pages[0].crs)
+            params["cursor"] = next_cursor
 
     def get_place_data(self, *, location: str, city: str) -> List[Dict[str, Union[str, Series]]]:
-        response = requests.get(self._connection + "/place", params={"city": city, "location": location})
+        response = self._get("/place", params={"city": city, "location": location})
 
         return response.json()
 
     def get_nearest_place_data(self, *, location: str, city: str, loc_id: int = 1) -> Dict[str, Union[str, Series]]:
-        response = requests.get(self._connection + "/nearest",
-                                params={"city": city, "location": location, "loc_id": loc_id})
+        response = self._get("/nearest", params={"city": city, "location": location, "loc_id": loc_id})
 
         return response.json()
 
-    def get_anomaly_data(self, location: str) -> List[Dict[str, Union[str, Union[str, NoneType, int, float]]]]:
-        response = requests.get(self._connection + "/anomaly", params={"city": location})
+    def get_nearest_place_data_many(self, *, places: List[Dict[str, Union[str, int, float]]], city: str,
+                                    meters: float = 500) -> List[Dict]:
+        response = self._post("/nearest/batch", json={"city": city, "places": places, "meters": meters})
+
+        return response.json()
+
+    def get_anomaly_data(self, location: str, *, deadline: Optional[float] = None) \
+            -> List[Dict[str, Union[str, Union[str, NoneType, int, float]]]]:
+        params = _anomaly_params(location, deadline)
+        if deadline is not None:
+            # Deadline responses may be degraded, so the server never gives them an ETag.
+            return _anomaly_features(self._get_json("/anomaly", params))
+
+        return _anomaly_features(self._get_json_cached("/anomaly", params))
+
+    def get_anomaly_frame(self, location: str, *, deadline: Optional[float] = None) -> 'GeoDataFrame':
+        """Assessed anomalies as a GeoDataFrame; with a deadline, ``frame.attrs["degradations"]`` lists what was cut."""
+        return self._get_frame("/anomaly", _anomaly_params(location, deadline), cached=deadline is None)
+
+    def submit_anomaly_job(self, location: str, *, percent: float = 0.05, nsmallest: int = 5) -> Dict:
+        response = self._post("/jobs", json={"city": location, "percent": percent, "nsmallest": nsmallest})
+
+        return response.json()
+
+    def get_job(self, job_id: str) -> Dict:
+        response = self._get(f"/jobs/{job_id}")
+
+        return response.json()
+
+
+class AsyncAnomalyDetectorConn:
+    """httpx-based async client for fanning out requests, e.g. anomalies for many cities at once.
+
+    Error statuses left after the last retry are raised as ``httpx.HTTPStatusError``.
+    """
+
+    def __init__(self, conn: str = "http://127.0.0.1:8000/", *,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = 3, backoff: float = 0.5,
+                 pool_size: int = 10, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_retry_after: float = MAX_RETRY_AFTER) -> None:
+        self._retries = retries
+        self._backoff = backoff
+        self._max_retry_after = max_retry_after
+        connect, read = timeout
+        self._client = httpx.AsyncClient(
+            base_url=conn,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=transport,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self) -> 'AsyncAnomalyDetectorConn':
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.aclose()
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self._max_retry_after)
+        return self._backoff * 2 ** attempt
+
+    async def _get(self, path: str, **kwargs: Any) -> httpx.Response:
+        for attempt in range(self._retries + 1):
+            try:
+                response = await self._client.get(path, **kwargs)
+            except httpx.TransportError:
+                if attempt == self._retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self._retries:
+                    return response
+
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def connected(self) -> bool:
+        response = await self._get("/")
+        if response.status_code != 200:
+            return False
+
+        return response.json() == {"status": "API running"}
+
+    async def get_anomaly_data(self, location: str, *, deadline: Optional[float] = None) -> List[Dict]:
+        response = await self._get("/anomaly", params=_anomaly_params(location, deadline))
+        # Still overloaded (or rejected) after every retry; an error body must not read as a city without anomalies.
+        response.raise_for_status()
+
+        return _anomaly_features(response.json())
+
+    async def get_anomaly_data_many(self, cities: List[str], *, limit: int = 4,
+                                    deadline: Optional[float] = None) -> Dict[str, List[Dict]]:
+        """Anomaly features per city, with at most ``limit`` requests in flight at once."""
+        semaphore = asyncio.Semaphore(limit)
+
+        async def fetch(city: str) -> List[Dict]:
+            async with semaphore:
+                return await self.get_anomaly_data(city, deadline=deadline)
 
-        raw = response.json()
-        geojson = json.loads(raw) if isinstance(raw, str) else raw
-        return geojson.get("features", [])
+        return dict(zip(cities, await asyncio.gather(*(fetch(city) for city in cities))))
@@ -0,0 +1,66 @@
+import io
+import json
+from typing import BinaryIO, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+ARROW = "application/vnd.apache.arrow.stream"
+GEOJSON = "application/geo+json"
+
+# Servers that predate format negotiation, or clients without pyarrow, get the GeoJSON fallback.
+_GEOJSON_ONLY = f"{GEOJSON}, application/json;q=0.9"
+
+
+def frame_accept() -> str:
+    """Accept header preferring Arrow when pyarrow is installed here."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return _GEOJSON_ONLY
+    return f"{ARROW}, {_GEOJSON_ONLY}"
+
+
+def read_arrow(source: Union[bytes, BinaryIO]) -> 'GeoDataFrame':
+    import pyarrow
+    from geopandas import GeoDataFrame
+
+    # Wrapping bytes in a pyarrow buffer lets the record batches reference them instead of copying.
+    reader = pyarrow.ipc.open_stream(pyarrow.py_buffer(source) if isinstance(source, bytes) else source)
+    # GeoArrow geometry columns are decoded in one vectorized pass, and carry their CRS in the field metadata.
+    return GeoDataFrame.from_arrow(reader.read_all(), to_pandas_kwargs={"split_blocks": True})
+
+
+def _features(stream: BinaryIO):
+    try:
+        import ijson
+    except ImportError:
+        yield from _features_from(json.load(stream))
+        return
+
+    stream = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+    if stream.peek(1).lstrip()[:1] == b'"':
+        # Older servers double-encoded the GeoJSON as a JSON string, which cannot be parsed incrementally.
+        yield from _features_from(json.load(stream))
+        return
+
+    yield from ijson.items(stream, "features.item", use_float=True)
+
+
+def _features_from(raw) -> list:
+    geojson = json.loads(raw) if isinstance(raw, str) else raw
+    return geojson.get("features", [])
+
+
+def read_geojson(source: Union[bytes, BinaryIO]) -> 'GeoDataFrame':
+    """Build a frame from a FeatureCollection one feature at a time, never holding the whole parsed document."""
+    from geopandas import GeoDataFrame
+
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    return GeoDataFrame.from_features(_features(stream), crs="EPSG:4326")
+
+
+def read_frame(source: Union[bytes, BinaryIO], content_type: Optional[str]) -> 'GeoDataFrame':
+    if content_type is not None and content_type.split(";")[0].strip().lower() == ARROW:
+        return read_arrow(source)
+    return read_geojson(source)
@@ -7,7 +7,9 @@ app = marimo.App(width="medium")
 @app.cell(hide_code=True)
 def _():
     import marimo as mo
+    import asyncio
     import json
+    import time
     import uuid
     import httpx
 
@@ -262,7 +264,7 @@ def _():
         "ZWE",
         "ALA"
     ]
-    return COUNTRY_CODES, httpx, json, mo, uuid
+    return COUNTRY_CODES, asyncio, httpx, json, mo, time, uuid
 
 
 @app.cell(hide_code=True)
@@ -273,8 +275,8 @@ def _(json):
         The returned string can be passed directly to mo.Html() inside a Marimo notebook.
         """
 
-        # The server serialises the GeoDataFrame as a JSON string, so the HTTP
-        # response body is a JSON-encoded string that itself contains GeoJSON.
+        # The server returns raw GeoJSON; older deployments returned it as a
+        # JSON-encoded string, so accept both.
         geojson = json.loads(response_json) if isinstance(response_json, str) else response_json
         features = geojson.get("features", [])
 
@@ -289,6 +291,100 @@ def _():
     return (conn,)
 
 
+@app.cell(hide_code=True)
+def _(conn, json, time):
+    try:
+        # Only available when the notebook runs in the browser under Pyodide.
+        from js import localStorage
+    except ImportError:
+        localStorage = None
+
+    class ResultCache:
+        """Anomaly results per normalized city query, kept in the browser's localStorage.
+
+        Entries are dropped when the server's pipeline version changes or after ``max_age`` seconds, and the least
+        recently used ones are evicted once the stored results exceed ``max_chars``. Outside the browser the cache
+        lives in memory for the session.
+        """
+
+        PREFIX = "gis-anomaly-detector:"
+        INDEX = PREFIX + "index"
+
+        def __init__(self, storage, max_chars: int = 2_000_000, max_age: float = 7 * 24 * 3600) -> None:
+            self._storage = storage
+            self._memory = {}
+            self._max_chars = max_chars
+            self._max_age = max_age
+
+        def _read(self, key: str):
+            return self._storage.getItem(key) if self._storage is not None else self._memory.get(key)
+
+        def _write(self, key: str, value: str) -> None:
+            if self._storage is not None:
+                self._storage.setItem(key, value)
+            else:
+                self._memory[key] = value
+
+        def _remove(self, key: str) -> None:
+            if self._storage is not None:
+                self._storage.removeItem(key)
+            else:
+                self._memory.pop(key, None)
+
+        def _index(self) -> dict:
+            raw = self._read(self.INDEX)
+            return json.loads(raw) if raw else {}
+
+        def _key(self, query: str) -> str:
+            # Matches the server's city normalization, so "Tulsa,  OK" and "tulsa, ok" share an entry.
+            return self.PREFIX + conn + "|" + " ".join(query.split()).casefold()
+
+        def _drop(self, index: dict, key: str) -> None:
+            index.pop(key, None)
+            self._remove(key)
+
+        def get(self, query: str, version):
+            index = self._index()
+            key = self._key(query)
+            entry = index.get(key)
+            if entry is None:
+                return None
+
+            raw = self._read(key)
+            if raw is None or entry["version"] != version or time.time() - entry["stored"] > self._max_age:
+                self._drop(index, key)
+                self._write(self.INDEX, json.dumps(index))
+                return None
+
+            entry["used"] = time.time()
+            self._write(self.INDEX, json.dumps(index))
+            return json.loads(raw)
+
+        def put(self, query: str, version, features: list) -> None:
+            index = self._index()
+            key = self._key(query)
+            raw = json.dumps(features)
+            if len(raw) > self._max_chars:
+                return
+
+            index[key] = {"version": version, "stored": time.time(), "used": time.time(), "size": len(raw)}
+            for old in sorted(index, key=lambda k: index[k]["used"]):
+                if sum(entry["size"] for entry in index.values()) <= self._max_chars:
+                    break
+                if old != key:
+                    self._drop(index, old)
+
+            try:
+                self._write(key, raw)
+                self._write(self.INDEX, json.dumps(index))
+            except Exception:
+                # The browser's storage quota is shared with other pages on the origin; skip caching when full.
+                self._drop(index, key)
+
+    result_cache = ResultCache(localStorage)
+    return (result_cache,)
+
+
 @app.cell(hide_code=True)
 def _(mo):
     mo.md(r"""
@@ -344,24 +440,6 @@ def _(form):
     return
 
 
-@app.cell(hide_code=True)
-def _(conn, form, httpx, is_form_valid, map_data, mo):
-    mo.stop(not is_form_valid())
-
-    user_city = form.value['user_city']
-    user_state = form.value['user_state']
-    user_country = form.value['user_country']
-
-    query = f"{user_city}, {user_state}, {user_country}"
-
-    print(query)
-
-    with httpx.Client(timeout=60 * 5) as client:
-        response = client.get(conn + "/anomaly", params={"city": query})
-        anomaly_data = map_data(response.json())
-    return (anomaly_data,)
-
-
 @app.cell(hide_code=True)
 def _(form, is_form_valid, mo):
     mo.md(f"""
@@ -371,13 +449,25 @@ def _(form, is_form_valid, mo):
 
 
 @app.cell(hide_code=True)
-def _(anomaly_data, json, mo, uuid):
-    def build_leaflet_map(features: list) -> str:
+def _(json, uuid):
+    # Context layers fetched from /layers for the visible area once the map is zoomed in far enough.
+    CONTEXT_LAYERS = {
+        "buildings": {"color": "#7f8c8d", "weight": 1, "fillOpacity": 0.15},
+        "edges": {"color": "#34495e", "weight": 1.5, "opacity": 0.6},
+    }
+    CONTEXT_MIN_ZOOM = 15
+    CONTEXT_LIMIT = 2000
+
+    def build_leaflet_map(features: list, server: str = None, city: str = None) -> str:
         """Return a self-contained HTML snippet that renders a Leaflet map for *features*.
 
         Each feature is expected to be a GeoJSON Feature whose properties include
         at minimum: name, risk_level, anomaly_score, explanation, suggested_check.
         Geometries must be in WGS84 (EPSG:4326).
+
+        Everything is drawn on a canvas and point features are clustered, so whole-city
+        results stay responsive. Given the *server* and *city*, buildings and roads in
+        view are loaded from ``/layers`` as the user pans and zooms.
         """
         map_id = "map-" + uuid.uuid4().hex[:10]
         geojson_payload = json.dumps({"type": "FeatureCollection", "features": features})
@@ -385,10 +475,21 @@ def _(anomaly_data, json, mo, uuid):
         return f"""
     <div id="{map_id}" style="height:520px;width:100%;border-radius:8px;"></div>
     <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" crossorigin=""/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.css" crossorigin=""/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css" crossorigin=""/>
     <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js" crossorigin=""></script>
+    <script src="https://unpkg.com/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js" crossorigin=""></script>
     <script>
         var geojson = {geojson_payload};
-        var map = L.map('{map_id}');
+        var server = {json.dumps(server)};
+        var city = {json.dumps(city)};
+        var CONTEXT_LAYERS = {json.dumps(CONTEXT_LAYERS)};
+        var CONTEXT_MIN_ZOOM = {CONTEXT_MIN_ZOOM};
+        var CONTEXT_LIMIT = {CONTEXT_LIMIT};
+
+        // One shared canvas instead of an SVG element per feature.
+        var renderer = L.canvas({{ padding: 0.5 }});
+        var map = L.map('{map_id}', {{ preferCanvas: true, renderer: renderer }});
 
         L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
             attribution: '&copy; OpenStreetMap contributors',
@@ -407,24 +508,191 @@ def _(anomaly_data, json, mo, uuid):
                    '<b>Suggested Check:</b> ' + (p.suggested_check || 'N/A');
         }}
 
-        var layer = L.geoJSON(geojson, {{
+        var anomalyOptions = {{
+            renderer: renderer,
             style: function(f) {{ return {{ color: riskColor(f.properties.risk_level), weight: 2, fillOpacity: 0.55 }}; }},
             pointToLayer: function(f, latlng) {{
-                return L.circleMarker(latlng, {{ radius: 11, fillColor: riskColor(f.properties.risk_level), color: '#222', weight: 1, fillOpacity: 0.85 }});
+                return L.circleMarker(latlng, {{ renderer: renderer, radius: 11, fillColor: riskColor(f.properties.risk_level), color: '#222', weight: 1, fillOpacity: 0.85 }});
             }},
             onEachFeature: function(f, layer) {{ layer.bindPopup(buildPopup(f.properties)); }}
-        }}).addTo(map);
+        }};
+
+        var points = L.geoJSON(null, anomalyOptions);
+        var shapes = L.geoJSON(null, anomalyOptions).addTo(map);
+        geojson.features.forEach(function(f) {{
+            (f.geometry && f.geometry.type === 'Point' ? points : shapes).addData(f);
+        }});
+
+        // chunkedLoading adds markers between animation frames, so thousands of points do not freeze the page.
+        var clusters = L.markerClusterGroup({{ chunkedLoading: true, disableClusteringAtZoom: 18, showCoverageOnHover: false }});
+        clusters.addLayers(points.getLayers());
+        clusters.addTo(map);
+
+        var bounds = points.getBounds();
+        if (shapes.getBounds().isValid()) {{
+            bounds = bounds.isValid() ? bounds.extend(shapes.getBounds()) : shapes.getBounds();
+        }}
+        if (bounds.isValid()) {{
+            map.fitBounds(bounds, {{ padding: [30, 30] }});
+        }} else {{
+            map.setView([0, 0], 2);
+        }}
 
-        if (layer.getBounds().isValid()) {{
-            map.fitBounds(layer.getBounds(), {{ padding: [30, 30] }});
+        if (server && city) {{
+            var status = L.control({{ position: 'bottomleft' }});
+            status.onAdd = function() {{
+                this._div = L.DomUtil.create('div', 'leaflet-bar');
+                this._div.style.cssText = 'background:#fff;padding:2px 6px;font:12px sans-serif;';
+                return this._div;
+            }};
+            status.addTo(map);
+            function setStatus(text) {{
+                status._div.textContent = text;
+                status._div.style.display = text ? 'block' : 'none';
+            }}
+
+            var context = {{}};
+            var overlays = {{}};
+            Object.keys(CONTEXT_LAYERS).forEach(function(name) {{
+                context[name] = L.geoJSON(null, {{ renderer: renderer, style: CONTEXT_LAYERS[name], interactive: false }}).addTo(map);
+                overlays[name] = context[name];
+            }});
+            L.control.layers(null, overlays).addTo(map);
+
+            // Layers whose frames have no name column, so later requests ask for geometry only.
+            var unnamed = {{}};
+            var inFlight = null;
+
+            async function loadLayer(name, bbox, signal) {{
+                var params = {{ city: city, bbox: bbox, limit: CONTEXT_LIMIT }};
+                if (!unnamed[name]) {{ params.columns = 'name'; }}
+                var response = await fetch(server + '/layers/' + name + '?' + new URLSearchParams(params), {{ signal: signal }});
+                if (response.status === 400 && !unnamed[name]) {{
+                    unnamed[name] = true;
+                    return loadLayer(name, bbox, signal);
+                }}
+                if (!response.ok) {{
+                    var retry = response.headers.get('Retry-After');
+                    throw new Error('server busy' + (retry ? ', retry in ' + retry + ' s' : ''));
+                }}
+
+                var lines = (await response.text()).split('\\n').filter(Boolean);
+                context[name].clearLayers();
+                context[name].addData(lines.map(JSON.parse));
+                return response.headers.get('X-Next-Cursor') !== null;
+            }}
+
+            function loadViewport() {{
+                if (inFlight) {{ inFlight.abort(); }}
+                if (map.getZoom() < CONTEXT_MIN_ZOOM) {{
+                    Object.values(context).forEach(function(layer) {{ layer.clearLayers(); }});
+                    setStatus('Zoom in to load buildings and roads');
+                    return;
+                }}
+
+                inFlight = new AbortController();
+                var b = map.getBounds();
+                var bbox = [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].map(function(v) {{ return v.toFixed(6); }}).join(',');
+                setStatus('Loading buildings and roads...');
+                Promise.all(Object.keys(context).map(function(name) {{ return loadLayer(name, bbox, inFlight.signal); }}))
+                    .then(function(truncated) {{
+                        setStatus(truncated.some(Boolean) ? 'Showing the first ' + CONTEXT_LIMIT + ' features; zoom in for all' : '');
+                    }})
+                    .catch(function(error) {{
+                        if (error.name !== 'AbortError') {{ setStatus('Context layers unavailable: ' + error.message); }}
+                    }});
+            }}
+
+            var debounce = null;
+            map.on('moveend', function() {{
+                clearTimeout(debounce);
+                debounce = setTimeout(loadViewport, 250);
+            }});
+            loadViewport();
         }}
     </script>
     """
 
+    return (build_leaflet_map,)
 
-    map_html = mo.iframe(build_leaflet_map(anomaly_data))
-    map_html
-    return
+
+@app.cell(hide_code=True)
+async def _(asyncio, build_leaflet_map, conn, form, httpx, is_form_valid, map_data, mo, result_cache):
+    mo.stop(not is_form_valid())
+
+    user_city = form.value['user_city']
+    user_state = form.value['user_state']
+    user_country = form.value['user_country']
+
+    query = f"{user_city}, {user_state}, {user_country}"
+
+    POLL_SECONDS = 1.5
+
+    def job_status(job: dict) -> str:
+        """Markdown checklist of the pipeline stages, marking the running one."""
+        stages = job.get("stages", [])
+        completed = round(job.get("progress", 0) * len(stages))
+        lines = []
+        for position, stage in enumerate(stages):
+            marker = "✅" if position < completed else ("⏳" if position == completed else "▫️")
+            lines.append(f"{marker} {stage}")
+        return f"**Validating {query}** ({job['status']})\n\n" + "\n\n".join(lines)
+
+    async def poll_job(client) -> list:
+        """Submit the city as a job and poll it without blocking the page, rendering provisional anomalies early."""
+        submitted = await client.post(conn + "/jobs", json={"city": query})
+        while submitted.status_code in (429, 503):
+            # The server is building other cold cities; wait as long as it asks and submit again.
+            mo.output.replace(mo.md(f"**Validating {query}**: waiting for the server to free up..."))
+            await asyncio.sleep(float(submitted.headers.get("Retry-After", POLL_SECONDS)))
+            submitted = await client.post(conn + "/jobs", json={"city": query})
+        submitted.raise_for_status()
+        job = submitted.json()
+
+        shown = None
+        while job["status"] not in ("done", "failed"):
+            # Only re-render when something changed, so the map is not rebuilt on every poll.
+            if (job["stage"], job.get("partial") is not None) != shown:
+                shown = (job["stage"], job.get("partial") is not None)
+                preview = map_data(job["partial"]) if job.get("partial") else []
+                mo.output.replace(mo.vstack([
+                    mo.md(job_status(job)),
+                    mo.iframe(build_leaflet_map(preview)) if preview else mo.md(""),
+                ]))
+
+            await asyncio.sleep(POLL_SECONDS)
+            response = await client.get(f"{conn}/jobs/{job['id']}")
+            response.raise_for_status()
+            job = response.json()
+
+        if job["status"] == "failed":
+            raise RuntimeError(job["error"])
+        return map_data(job["result"])
+
+    async def pipeline_version(client):
+        """The server's detector and LLM version; results cached under another version are refetched."""
+        response = await client.get(conn + "/version")
+        return response.json().get("pipeline") if response.status_code == 200 else None
+
+    async with httpx.AsyncClient(timeout=60 * 5) as client:
+        version = await pipeline_version(client)
+        anomaly_data = result_cache.get(query, version)
+
+        if anomaly_data is None:
+            try:
+                anomaly_data = await poll_job(client)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in (404, 405):
+                    raise
+                # Deployments without the job queue still answer the synchronous endpoint.
+                mo.output.replace(mo.md(f"**Validating {query}**..."))
+                response = await client.get(conn + "/anomaly", params={"city": query})
+                response.raise_for_status()
+                anomaly_data = map_data(response.json())
+            result_cache.put(query, version, anomaly_data)
+
+    mo.output.replace(mo.iframe(build_leaflet_map(anomaly_data, server=conn, city=query)))
+    return (anomaly_data,)
 
 
 @app.cell(hide_code=True)
@@ -0,0 +1,259 @@
+"""Run every CityData stage on synthetic cities of growing size and report time and peak memory per stage.
+
+Run from the repository root: ``python benchmarks/city_scaling.py [--sizes 1000 10000 100000 1000000]
+[--report city_scaling.json] [--baseline previous.json] [--tolerance 1.5] [--max-exponent 1.3]``.
+
+Each size runs in a fresh interpreter, so peak RSS is per city. Everything is offline: the cities are generated
+here and the LLM stage uses the fake backend. The report is JSON, and the exit status is 1 when a stage is slower
+than ``tolerance`` times its baseline time or grows faster than ``n ** max_exponent`` between two sizes.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import shapely
+from geopandas import GeoDataFrame
+
+# The server package is imported from the repository root, whichever directory this is run from.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Tulsa, OK; any mid-latitude origin works, the city only has to fall inside one UTM zone.
+_ORIGIN = (-95.99, 36.15)
+_METERS_PER_DEGREE = 111_320
+# Amenities per km² and streets every this many meters keep neighbourhood sizes constant as the city grows.
+_DENSITY = 100
+_BLOCK_METERS = 150
+_BUILDING_METERS = 20
+_NEAREST_PLACES = 100
+
+# Stages faster than this are dominated by noise and are not checked for regressions.
+_MIN_SECONDS = 0.05
+
+
+def synthetic_city(amenities: int, seed: int = 0) -> Tuple[GeoDataFrame, nx.MultiDiGraph]:
+    """An OSM-shaped feature frame and drive graph: named points, footprints and lines, unnamed buildings and a
+    two-way street grid, all in WGS84."""
+    rng = np.random.default_rng(seed)
+    lon, lat = _ORIGIN
+    side = math.sqrt(amenities / _DENSITY) * 1000
+    degrees_x = side / (_METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    degrees_y = side / _METERS_PER_DEGREE
+    width = _BUILDING_METERS / _METERS_PER_DEGREE
+
+    def coordinates(count: int) -> Tuple[np.ndarray, np.ndarray]:
+        return lon + rng.random(count) * degrees_x, lat + rng.random(count) * degrees_y
+
+    # Most amenities are nodes; the rest are footprints, multi-part footprints and lines, as in real extracts.
+    kinds = rng.choice(4, size=amenities, p=[0.8, 0.1, 0.05, 0.05])
+    x, y = coordinates(amenities)
+    geometries = shapely.points(x, y)
+    footprints = shapely.box(x, y, x + width, y + width)
+    geometries[kinds == 1] = footprints[kinds == 1]
+    multi = np.flatnonzero(kinds == 2)
+    geometries[multi] = shapely.multipolygons(np.stack([footprints[multi],
+                                                        shapely.box(x + width * 2, y, x + width * 3, y + width)[multi]],
+                                                       axis=1))
+    lines = kinds == 3
+    geometries[lines] = shapely.linestrings(np.stack([np.stack([x, y], axis=1),
+                                                      np.stack([x + width * 4, y], axis=1)], axis=1)[lines])
+
+    buildings = amenities // 2
+    bx, by = coordinates(buildings)
+    amenity_names = np.array([f"Amenity {i}" for i in range(amenities)], dtype=object)
+    features = GeoDataFrame({
+        "name": np.concatenate([amenity_names, np.full(buildings, None, dtype=object)]),
+        "amenity": np.concatenate([np.full(amenities, "cafe", dtype=object), np.full(buildings, None, dtype=object)]),
+        "building": np.concatenate([np.where(kinds == 0, None, "yes"), np.full(buildings, "yes", dtype=object)]),
+    }, geometry=np.concatenate([geometries, shapely.box(bx, by, bx + width, by + width)]), crs="EPSG:4326")
+    features.index = pd.MultiIndex.from_arrays([
+        np.concatenate([np.where(kinds == 0, "node", "way"), np.full(buildings, "way")]),
+        np.arange(len(features)),
+    ], names=["element", "id"])
+
+    blocks = max(2, int(side // _BLOCK_METERS) + 1)
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    graph.add_nodes_from((row * blocks + column, {"x": lon + column * degrees_x / (blocks - 1),
+                                                  "y": lat + row * degrees_y / (blocks - 1)})
+                         for row in range(blocks) for column in range(blocks))
+    for row in range(blocks):
+        for column in range(blocks):
+            node = row * blocks + column
+            neighbours = ([node + 1] if column < blocks - 1 else []) + ([node + blocks] if row < blocks - 1 else [])
+            for neighbour in neighbours:
+                for u, v in ((node, neighbour), (neighbour, node)):
+                    graph.add_edge(u, v, key=0, osmid=u * blocks * blocks + v, length=float(_BLOCK_METERS),
+                                   highway="residential")
+    return features, graph
+
+
+def run_city(amenities: int, seed: int, trace_memory: bool) -> Dict[str, Any]:
+    """Build one synthetic city and run it through every CityData stage, in this interpreter."""
+    os.environ["LLM_BACKEND"] = "fake"
+    from server.api.anomaly_detection import CityData
+    from server.api.metrics import stage, track_request
+    from server.api.shared_cache import SharedCityStore
+
+    generation_start = time.perf_counter()
+    features, graph = synthetic_city(amenities, seed)
+    generation_seconds = time.perf_counter() - generation_start
+
+    if trace_memory:
+        tracemalloc.start()
+
+    with track_request() as timings, tempfile.TemporaryDirectory() as directory:
+        city_data = CityData(features, graph)
+        city_data.ai_anomaly_response()
+
+        positions = np.random.default_rng(seed).choice(len(city_data.amenities), size=min(_NEAREST_PLACES,
+                                                       len(city_data.amenities)), replace=False)
+        with stage("nearest_batch", rows=len(positions)):
+            city_data.nearest_batch([{"position": int(position)} for position in positions])
+
+        store = SharedCityStore(directory)
+        store.save("benchmark", "benchmark", city_data)
+        store.load("benchmark")
+
+    if trace_memory:
+        tracemalloc.stop()
+
+    stages: Dict[str, Dict[str, Any]] = {}
+    for timing in timings.stages:
+        # A stage that runs more than once (e.g. a lazily projected layer) is reported as its total.
+        entry = stages.setdefault(timing.name, {"seconds": 0.0, "rows": timing.rows, "peak_memory_bytes": None})
+        entry["seconds"] += timing.seconds
+        if timing.peak_memory is not None:
+            entry["peak_memory_bytes"] = max(entry["peak_memory_bytes"] or 0, timing.peak_memory)
+
+    return {
+        "amenities": amenities,
+        "buildings": int(features["building"].notna().sum()),
+        "graph_nodes": graph.number_of_nodes(),
+        "graph_edges": graph.number_of_edges(),
+        "generation_seconds": generation_seconds,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "stages": stages,
+    }
+
+
+def _measure(amenities: int, seed: int, trace_memory: bool) -> Dict[str, Any]:
+    command = [sys.executable, __file__, "--city", str(amenities), "--seed", str(seed)]
+    if not trace_memory:
+        command.append("--no-trace-memory")
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def _size_entry(results: List[Dict[str, Any]], amenities: int) -> Optional[Dict[str, Any]]:
+    return next((result for result in results if result["amenities"] == amenities), None)
+
+
+def check_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Attach ``threshold_seconds`` (and ``threshold_memory_bytes``) from the baseline to every stage."""
+    regressions = []
+    for result in results:
+        previous = _size_entry(baseline, result["amenities"])
+        if previous is None:
+            continue
+        for name, entry in result["stages"].items():
+            before = previous["stages"].get(name)
+            if before is None:
+                continue
+            entry["threshold_seconds"] = max(before["seconds"], _MIN_SECONDS) * tolerance
+            if entry["seconds"] > entry["threshold_seconds"]:
+                regressions.append(f"{name} at {result['amenities']} amenities: {entry['seconds']:.3f}s > "
+                                   f"{entry['threshold_seconds']:.3f}s")
+            if entry["peak_memory_bytes"] is not None and before.get("peak_memory_bytes") is not None:
+                entry["threshold_memory_bytes"] = int(before["peak_memory_bytes"] * tolerance)
+                if entry["peak_memory_bytes"] > entry["threshold_memory_bytes"]:
+                    regressions.append(f"{name} at {result['amenities']} amenities: {entry['peak_memory_bytes']} "
+                                       f"bytes > {entry['threshold_memory_bytes']} bytes")
+    return regressions
+
+
+def check_scaling(results: List[Dict[str, Any]], max_exponent: float) -> Tuple[Dict[str, float], List[str]]:
+    """Fit the growth exponent of each stage between consecutive sizes, which needs no baseline and no fixed
+    hardware: a stage that turns quadratic shows up as an exponent near 2 on any machine."""
+    exponents: Dict[str, float] = {}
+    regressions = []
+    ordered = sorted(results, key=lambda result: result["amenities"])
+    for smaller, larger in zip(ordered, ordered[1:]):
+        for name, entry in larger["stages"].items():
+            before = smaller["stages"].get(name)
+            if before is None or before["seconds"] < _MIN_SECONDS or entry["seconds"] < _MIN_SECONDS:
+                continue
+            exponent = math.log(entry["seconds"] / before["seconds"]) / \
+                math.log(larger["amenities"] / smaller["amenities"])
+            exponents[name] = max(exponents.get(name, -math.inf), exponent)
+            if exponent > max_exponent:
+                regressions.append(f"{name} grows as n^{exponent:.2f} from {smaller['amenities']} to "
+                                   f"{larger['amenities']} amenities")
+    return exponents, regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=_DEFAULT_SIZES, help="Amenity counts to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default="city_scaling.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="An earlier report to compare stage times and memory against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Maximum ratio to the baseline")
+    parser.add_argument("--max-exponent", type=float, default=1.3,
+                        help="Maximum growth exponent of a stage's time between two sizes")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="Skip tracemalloc, which slows the Python-heavy stages down")
+    parser.add_argument("--city", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.city is not None:
+        print(json.dumps(run_city(args.city, args.seed, args.trace_memory)))
+        return 0
+
+    results = []
+    for amenities in args.sizes:
+        result = _measure(amenities, args.seed, args.trace_memory)
+        results.append(result)
+        print(f"{amenities} amenities: " + ", ".join(f"{name} {entry['seconds']:.3f}s"
+                                                     for name, entry in result["stages"].items()))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions += check_baseline(results, json.load(file)["sizes"], args.tolerance)
+    exponents, scaling_regressions = check_scaling(results, args.max_exponent)
+    regressions += scaling_regressions
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "trace_memory": args.trace_memory,
+        "thresholds": {"tolerance": args.tolerance, "max_exponent": args.max_exponent, "min_seconds": _MIN_SECONDS,
+                       "baseline": args.baseline},
+        "sizes": results,
+        "exponents": exponents,
+        "regressions": regressions,
+    }
+    with open(args.report, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
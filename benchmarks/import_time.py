@@ -0,0 +1,39 @@
+"""Measure the cold import time of the server app and fail when it regresses.
+
+Run from the repository root: ``python benchmarks/import_time.py [--runs 5] [--threshold 1.5]``.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+_SNIPPET = (
+    "import time; start = time.perf_counter(); import server.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure(runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _SNIPPET], check=True, capture_output=True, text=True)
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=1.5, help="Maximum median import time in seconds")
+    args = parser.parse_args()
+
+    timings = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"import server.main: median {median:.3f}s over {args.runs} runs (min {min(timings):.3f}s, "
+          f"max {max(timings):.3f}s, threshold {args.threshold:.3f}s)")
+
+    return 0 if median <= args.threshold else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, Optional
+
+from fastapi import HTTPException, Request
+
+from server.api import settings
+from server.api.city_cache import CityCache, CITY_CACHE, normalize_city
+from server.api.metrics import METRICS
+
+_LOGGER = logging.getLogger(__name__)
+
+METRICS.describe("admission_rejections_total", "Cold requests turned away by admission control, by reason.")
+METRICS.describe("admission_cold_area_km2", "Estimated boundary area of the cold computations currently admitted.")
+
+# Weight given to the latest cold computation in the moving average behind Retry-After.
+_DURATION_SMOOTHING = 0.3
+
+
+@lru_cache(maxsize=512)
+def _geocoded_area_km2(city: str) -> float:
+    import osmnx
+
+    boundary = osmnx.geocode_to_gdf(city)
+    return float(boundary.to_crs(boundary.estimate_utm_crs()).area.sum()) / 1e6
+
+
+def boundary_area_km2(city: str) -> Optional[float]:
+    """Area of the place's geocoded boundary, or None when it cannot be geocoded.
+
+    Only successful lookups are cached, so a transient geocoder error is retried by the next request for the city.
+    """
+    try:
+        return _geocoded_area_km2(city)
+    except Exception as e:
+        _LOGGER.info("Could not geocode %s for admission: %s", city, e)
+        return None
+
+
+def client_for(request: Request) -> str:
+    return request.client.host if request.client is not None else "unknown"
+
+
+@dataclass
+class Ticket:
+    key: str
+    client: str
+    area: float
+    leader: bool
+    started: float
+
+
+class AdmissionController:
+    """Budgets concurrent cold city builds by estimated boundary area, per client and across the process.
+
+    Requests for warm cities, and requests for a city that is already being built, are admitted without a ticket
+    or join the running build, so they never wait on the budget.
+    """
+
+    def __init__(self, cache: CityCache, max_area: float = settings.ADMISSION_MAX_AREA_KM2,
+                 max_features: int = settings.ADMISSION_MAX_FEATURES, budget: float = settings.ADMISSION_BUDGET_KM2,
+                 default_area: float = settings.ADMISSION_DEFAULT_AREA_KM2, per_client: int = settings.ADMISSION_PER_CLIENT,
+                 retry_after: float = settings.ADMISSION_RETRY_AFTER) -> None:
+        self._cache = cache
+        self._max_area = max_area
+        self._max_features = max_features
+        self._budget = budget
+        self._default_area = default_area
+        self._per_client = per_client
+        self._cold_seconds = retry_after
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = defaultdict(int)
+        self._per_client_active: Dict[str, int] = defaultdict(int)
+        self._area_in_use = 0.0
+        # Feature counts of cities built before, which outlive their cache entries.
+        self._features: Dict[str, int] = {}
+
+    def _retry_after(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self._cold_seconds)))}
+
+    def _reject(self, status_code: int, reason: str, detail: str, retry: bool = True) -> HTTPException:
+        METRICS.increment("admission_rejections_total", reason=reason)
+        return HTTPException(status_code=status_code, detail=detail, headers=self._retry_after() if retry else None)
+
+    def _estimate_area(self, city: str, key: str, background: bool) -> float:
+        features = self._features.get(key)
+        if not background and features is not None and features > self._max_features:
+            raise self._reject(422, "too_large", f"'{city}' has {features} features, more than the "
+                               f"{self._max_features} allowed synchronously; submit it to POST /jobs instead",
+                               retry=False)
+
+        area = boundary_area_km2(key)
+        if not background and area is not None and area > self._max_area:
+            raise self._reject(422, "too_large", f"'{city}' covers {area:.0f} km², more than the {self._max_area:.0f} "
+                               f"km² allowed synchronously; submit it to POST /jobs instead", retry=False)
+
+        return min(area if area is not None else self._default_area, self._budget)
+
+    def acquire(self, city: str, client: str, background: bool = False, rebuild: bool = False) -> Optional[Ticket]:
+        """Admit a request for ``city``, raising 422, 429 or 503 when it cannot run now. Blocks while geocoding.
+
+        ``background`` builds (jobs) may exceed the synchronous size limits, but still count against the budgets.
+        A ``rebuild`` of a city that is already warm, e.g. a scheduled refresh, is checked like a cold build.
+        """
+        if not rebuild and self._cache.is_warm(city):
+            return None
+
+        key = normalize_city(city)
+        with self._lock:
+            if self._active.get(key, 0) > 0:
+                self._active[key] += 1
+                return Ticket(key, client, 0.0, leader=False, started=time.perf_counter())
+
+        area = self._estimate_area(city, key, background)
+
+        with self._lock:
+            if self._active.get(key, 0) > 0:
+                self._active[key] += 1
+                return Ticket(key, client, 0.0, leader=False, started=time.perf_counter())
+
+            if self._per_client_active.get(client, 0) >= self._per_client:
+                raise self._reject(429, "client_limit", "Too many cold cities requested at once from this client")
+            # A lone request is always admitted, so cities between the budget and the maximum area can still run.
+            if self._area_in_use > 0 and self._area_in_use + area > self._budget:
+                raise self._reject(503, "overloaded", "The server is busy building other cities")
+
+            self._active[key] += 1
+            self._per_client_active[client] += 1
+            self._area_in_use += area
+            METRICS.set_gauge("admission_cold_area_km2", self._area_in_use)
+
+        return Ticket(key, client, area, leader=True, started=time.perf_counter())
+
+    def release(self, ticket: Optional[Ticket]) -> None:
+        if ticket is None:
+            return
+
+        city_data = self._cache.peek(ticket.key)
+
+        with self._lock:
+            self._active[ticket.key] -= 1
+            if self._active[ticket.key] == 0:
+                del self._active[ticket.key]
+
+            if ticket.leader:
+                self._per_client_active[ticket.client] -= 1
+                if self._per_client_active[ticket.client] == 0:
+                    del self._per_client_active[ticket.client]
+                self._area_in_use = max(0.0, self._area_in_use - ticket.area)
+                METRICS.set_gauge("admission_cold_area_km2", self._area_in_use)
+
+                self._cold_seconds += _DURATION_SMOOTHING * (time.perf_counter() - ticket.started - self._cold_seconds)
+                if city_data is not None:
+                    self._features[ticket.key] = len(city_data.dataset)
+
+    def build_in_background(self, city: str, client: str) -> None:
+        """Start building a cold city that no request will wait for, under a ticket, unless it is already being
+        built. Raises like ``acquire`` when the build cannot be admitted."""
+        ticket = self.acquire(city, client)
+        if ticket is None or not ticket.leader:
+            self.release(ticket)
+            return
+
+        def build() -> None:
+            try:
+                self._cache.get(city)
+            except Exception:
+                _LOGGER.exception("Background build of %s failed", city)
+            finally:
+                self.release(ticket)
+
+        threading.Thread(target=build, name="cold-build", daemon=True).start()
+
+    @contextmanager
+    def admit(self, city: str, client: str) -> Iterator[None]:
+        ticket = self.acquire(city, client)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+
+ADMISSION = AdmissionController(CITY_CACHE)
@@ -1,43 +1,129 @@
-from typing import Optional, Tuple, List
+import hashlib
+import time
+import uuid
+from functools import lru_cache, cached_property
+from typing import Optional, Tuple, List, Callable, Dict, Any
 
-import anthropic
+import numpy as np
 import osmnx
+import shapely
 from geopandas import GeoDataFrame
 from networkx.classes import MultiDiGraph
-from pandas import Series, isna, DataFrame
-from shapely import Polygon
+from pandas import Series, DataFrame, concat
+from shapely.geometry.base import BaseGeometry
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
-from server.api.claude_client import ClaudeClient
-from server.api.constants import DATA_HEADERS, LOCATION_TAGS, ANOMALY_HEADERS
-from server.api.utilities import is_geometrical_entry, get_center_of_polygon, to_meters
+from server.api import settings
+from server.api.claude_client import ClaudeClient, PROMPT_VERSION
+from server.api.deadline import Deadline, STAGE_COSTS, FAST_DETECTOR, SAMPLED_SUBSET, SKIPPED_LLM
+from server.api.constants import DATA_HEADERS, LOCATION_TAGS, ANOMALY_HEADERS, ASSESSMENT_HEADERS, \
+    PIPELINE_STAGES, EXPORT_LAYERS
+from server.api.llm_backend import get_llm_backend
+from server.api.metrics import stage
+from server.api.triage import triage_anomalies, model_only_assessments, LLM_SOURCE, PENDING_LLM_EXPLANATION
+from server.api.projection import ProjectionContext
+from server.api.utilities import representative_point, representative_points
 
-_CLAUDE_CLIENT = ClaudeClient(anthropic.Anthropic())
+
+ProgressCallback = Callable[[str], None]
+# Receives provisional assessments while the LLM is still working on the final ones.
+PreviewCallback = Callable[[GeoDataFrame], None]
+
+_FULL_FOREST = 100
+_FAST_FOREST = 25
+_MIN_SAMPLE = 256
+_RANDOM_STATE = 42
+# Identifies the detector configuration behind scores, alongside the snapshot and prompt in assessment versions.
+DETECTOR_VERSION = f"isolation_forest-{_FULL_FOREST}-{_RANDOM_STATE}"
+# Share of the remaining deadline the detector may use; the rest is kept for triage, the LLM and encoding.
+_DETECTOR_SHARE = 0.4
+
+
+def pipeline_version() -> str:
+    """Identifies the detector, LLM and prompt behind assessments, independently of any city snapshot."""
+    parts = [DETECTOR_VERSION, settings.LLM_BACKEND, settings.LLM_MODEL, PROMPT_VERSION]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+def _no_progress(stage: str) -> None:
+    pass
+
+
+def _no_preview(assessed: GeoDataFrame) -> None:
+    pass
+
+
+@lru_cache(maxsize=1)
+def get_claude_client() -> ClaudeClient:
+    return ClaudeClient(get_llm_backend())
 
 
 def get_location_data(location: str) -> Tuple[GeoDataFrame, MultiDiGraph]:
-    return (osmnx.features_from_place(location, tags=LOCATION_TAGS),
-            osmnx.graph_from_place(location, network_type="drive"))
+    with stage("overpass_features") as timing:
+        features = osmnx.features_from_place(location, tags=LOCATION_TAGS)
+        timing.rows = len(features)
+
+    with stage("overpass_graph") as timing:
+        graph = osmnx.graph_from_place(location, network_type="drive")
+        timing.rows = graph.number_of_edges()
+
+    return features, graph
 
 
 class CityData:
     def __init__(self,
                  location_geo: GeoDataFrame,
                  street_graph: MultiDiGraph,
+                 progress: ProgressCallback = _no_progress,
                  ):
-        self._full_dataset = to_meters(location_geo)
-        _, self._edges = osmnx.graph_to_gdfs(street_graph)
-        self._edges = to_meters(self._edges)
-        self._street_graph = osmnx.projection.project_graph(street_graph, to_crs=self._edges.crs)
+        progress(PIPELINE_STAGES[1])
+        self.snapshot = uuid.uuid4().hex
+        # One CRS for every layer, so features and streets cannot land in different UTM zones.
+        self.projection = ProjectionContext.for_city(location_geo, street_graph)
+        self._full_dataset = self.projection.project_frame(location_geo, "features")
+        self._street_graph = self.projection.project_graph(street_graph)
+        with stage("graph_to_gdfs", rows=street_graph.number_of_edges()):
+            # Edges come from the projected graph, so their geometries need no second projection.
+            self._edges = osmnx.graph_to_gdfs(self._street_graph, nodes=False)
         self._buildings = self._full_dataset[self._full_dataset["building"].notna()]
-        self._amenities = self._full_dataset[self._full_dataset['name'].notna()]
-        self._amenities = self._amenities.merge(self._get_anomaly_dataframe(self._amenities), on="name", how="left")
+        self._assessments: Dict[Tuple[float, int], GeoDataFrame] = {}
+        # The OSM (element, id) index is kept as columns, and amenities are addressed by position from here on.
+        self._amenities = self._full_dataset[self._full_dataset['name'].notna()].reset_index()
+        progress(PIPELINE_STAGES[2])
+        points = self.amenity_points
+        with stage("feature_engineering", rows=len(self._amenities)):
+            # Features line up with the amenities row for row, so places sharing a name keep their own values.
+            self._amenities = self._amenities.join(self._get_anomaly_dataframe(self._amenities, points))
 
     @classmethod
-    def from_location(cls, location: str) -> 'CityData':
+    def from_frames(cls, dataset: GeoDataFrame, edges: GeoDataFrame, amenities: GeoDataFrame,
+                    graph_nodes: GeoDataFrame, graph_attrs: Dict[str, Any], snapshot: str,
+                    assessments: Optional[Dict[Tuple[float, int], GeoDataFrame]] = None) -> 'CityData':
+        """Rebuild a CityData from already projected and feature-engineered frames, e.g. the shared cache.
+
+        The street graph is only reassembled from its node and edge frames when something first needs it.
+        ``assessments`` are full-quality ``ai_anomaly_response`` results already computed for this snapshot.
+        """
+        city_data = cls.__new__(cls)
+        city_data.snapshot = snapshot
+        city_data.projection = ProjectionContext(dataset.crs)
+        city_data._full_dataset = dataset
+        city_data._edges = edges
+        city_data._street_graph = None
+        city_data._graph_nodes = graph_nodes
+        city_data._graph_attrs = graph_attrs
+        city_data._buildings = dataset[dataset["building"].notna()]
+        city_data._assessments = dict(assessments or {})
+        city_data._amenities = amenities
+        return city_data
+
+    @classmethod
+    def from_location(cls, location: str, progress: ProgressCallback = _no_progress) -> 'CityData':
+        progress(PIPELINE_STAGES[0])
         return CityData(
-            *get_location_data(location)
+            *get_location_data(location),
+            progress=progress,
         )
 
     @property
@@ -46,6 +132,8 @@ class CityData:
 
     @property
     def street_graph(self) -> MultiDiGraph:
+        if self._street_graph is None:
+            self._street_graph = osmnx.graph_from_gdfs(self._graph_nodes, self._edges, graph_attrs=self._graph_attrs)
         return self._street_graph
 
     @property
@@ -60,28 +148,39 @@ class CityData:
     def buildings(self) -> GeoDataFrame:
         return self._buildings
 
+    @cached_property
+    def scored_amenities(self) -> GeoDataFrame:
+        scores = self._anomalies_detected(self._amenities)
+        return self._amenities.join(scores[ANOMALY_HEADERS[1:]])
+
+    def get_layer(self, name: str) -> GeoDataFrame:
+        layers = dict(zip(EXPORT_LAYERS, (self._full_dataset, self._edges, self._buildings, self._amenities)))
+        return layers[name]
+
     @staticmethod
-    def _anomalies_detected(dataframe: DataFrame, percent: float = 0.05) -> DataFrame:
+    def _anomalies_detected(dataframe: DataFrame, percent: float = 0.05, n_estimators: int = 100) -> DataFrame:
         ids = dataframe[DATA_HEADERS[0]]
 
         vals_only = dataframe[DATA_HEADERS].drop(columns=[DATA_HEADERS[0]])
         vals_only = vals_only.fillna(0)
 
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(vals_only)
+        with stage("isolation_forest", rows=len(vals_only)) as timing:
+            scaler = StandardScaler()
+            X_scaled = scaler.fit_transform(vals_only)
 
-        # Train model
-        model = IsolationForest(
-            n_estimators=100,
-            contamination=percent,
-            random_state=42
-        )
+            # Train model
+            model = IsolationForest(
+                n_estimators=n_estimators,
+                contamination=percent,
+                random_state=_RANDOM_STATE
+            )
 
-        model.fit(X_scaled)
+            model.fit(X_scaled)
 
-        scores = model.decision_function(X_scaled)
-        preds = model.predict(X_scaled)
+            scores = model.decision_function(X_scaled)
+            preds = model.predict(X_scaled)
 
+        STAGE_COSTS.record("isolation_forest", timing.seconds * _FULL_FOREST / n_estimators, len(vals_only))
         is_anomaly = (preds == -1).astype(int)
 
         results = DataFrame({
@@ -92,83 +191,223 @@ class CityData:
 
         return results
 
-    def _get_anomaly_dataframe(self, amenities: GeoDataFrame) -> GeoDataFrame:
-        data = {DATA_HEADERS[0]: [], DATA_HEADERS[1]: [], DATA_HEADERS[2]: [], DATA_HEADERS[3]: [], DATA_HEADERS[4]: []}
-
-        for _, location in amenities.iterrows():
-            if isna(location['name']):
-                continue
-
-            nearest_st = self.get_nearest_street(location)
-            nearest_st_distance = (
-                nearest_st["geometry"].distance(location["geometry"]) if nearest_st is not None else 0
-            )
-
-            _, nearest_location_distance = self.get_nearest_location(location)
-            nearest_location_distance = nearest_location_distance or 0
-
-            if isinstance(location['name'], float):
-                continue
-            else:
-                name = location['name']
-
-            data[DATA_HEADERS[0]].append(name)
-            data[DATA_HEADERS[1]].append(nearest_st_distance)
-            data[DATA_HEADERS[2]].append(nearest_location_distance)
-            data[DATA_HEADERS[3]].append(len(self.get_nearby_locations(location, meters=500)))
-            data[DATA_HEADERS[4]].append(len(self.intersects_other_locations(location)))
-
-        return GeoDataFrame(data)
+    def _get_anomaly_dataframe(self, amenities: GeoDataFrame, points: np.ndarray) -> DataFrame:
+        """Feature columns indexed like ``amenities``, from spatial-index queries over all of them at once.
+
+        ``points`` are the representative points of ``amenities``; streets and containing buildings are looked up
+        from those, while distances between amenities use their full geometries. Rows without a text name get NaN.
+        """
+        names = amenities["name"].to_numpy(dtype=object)
+        named = np.flatnonzero([isinstance(name, str) for name in names])
+        geometries = np.asarray(amenities.geometry.values, dtype=object)[named]
+        points = points[named]
+        count = len(named)
+
+        street_distances = np.zeros(count)
+        if len(self._edges) > 0 and count > 0:
+            street_input, street_tree = self._edges.sindex.nearest(points, return_all=False)
+            street_geometries = np.asarray(self._edges.geometry.values, dtype=object)
+            street_distances[street_input] = shapely.distance(street_geometries[street_tree], geometries[street_input])
+
+        location_distances = np.zeros(count)
+        (location_input, _), distances = self._amenities.sindex.nearest(
+            geometries, return_all=False, exclusive=True, return_distance=True)
+        location_distances[location_input] = distances
+
+        all_names = self._amenities["name"].to_numpy(dtype=object)
+        nearby_input, nearby_tree = self._amenities.sindex.query(geometries, predicate="dwithin", distance=500)
+        other = all_names[nearby_tree] != names[named][nearby_input]
+        density = np.bincount(nearby_input[other], minlength=count)
+
+        building_input, _ = self._buildings.sindex.query(points, predicate="within")
+        intersections = np.bincount(building_input, minlength=count)
+
+        return DataFrame({
+            DATA_HEADERS[1]: street_distances,
+            DATA_HEADERS[2]: location_distances,
+            DATA_HEADERS[3]: density,
+            DATA_HEADERS[4]: intersections,
+        }, index=amenities.index[named]).reindex(amenities.index)
+
+    @cached_property
+    def amenity_points(self) -> np.ndarray:
+        """Representative point of every amenity, by position."""
+        with stage("geometry_normalization", rows=len(self._amenities)):
+            return representative_points(self._amenities.geometry.values)
+
+    def positions_named(self, location_name: str) -> np.ndarray:
+        return np.flatnonzero(self._amenities["name"].to_numpy() == location_name)
 
     def get_place_of_interest(self, location_name: str) -> List[Series]:
-        return [self._amenities.iloc[x] for x in range(len(self._amenities)) if
-                location_name == self._amenities.iloc[x]['name']]
+        return [self._amenities.iloc[position] for position in self.positions_named(location_name)]
 
     def get_nearest_street(self, location: Series) -> Optional[Series]:
-        if not is_geometrical_entry(location):
+        geometry = location.get("geometry")
+        if not isinstance(geometry, BaseGeometry) or geometry.is_empty or len(self._edges) == 0:
             return None
 
-        p = location["geometry"]
-
-        if isinstance(location["geometry"], Polygon):
-            p = get_center_of_polygon(location)
-
-        u, v, key = osmnx.distance.nearest_edges(
-            self._street_graph,
-            X=p.x,
-            Y=p.y
-        )
-
-        nearest = self._edges.loc[(u, v, key)]
-
-        return nearest
+        _, tree = self._edges.sindex.nearest(representative_point(geometry), return_all=False)
+        return self._edges.iloc[tree[0]]
 
     def get_nearby_locations(self, location: Series, *, meters: int) -> List[Series]:
-        return [self._amenities.iloc[x] for x in range(len(self._amenities)) if
-                self._amenities.geometry.iloc[x].distance(location['geometry']) < meters and self._amenities.iloc[x][
-                    'name'] != location['name']]
+        positions = self._amenities.sindex.query(location["geometry"], predicate="dwithin", distance=meters)
+        names = self._amenities["name"].to_numpy(dtype=object)
+        return [self._amenities.iloc[x] for x in np.sort(positions) if names[x] != location["name"]]
 
-    def get_nearest_location(self, location: Series) -> Tuple[Optional[Series], Optional[int]]:
-        min_location_distance = min(
-            self._amenities.geometry.iloc[x].distance(location['geometry']) for x in range(len(self._amenities)) if
-            self._amenities.geometry.iloc[x] != location['geometry'])
-        min_location = [self._amenities.iloc[x] for x in range(len(self._amenities)) if
-                        self._amenities.geometry.iloc[x].distance(location['geometry']) == min_location_distance][0]
-
-        return min_location, min_location_distance
+    def get_nearest_location(self, location: Series) -> Tuple[Optional[Series], Optional[float]]:
+        (_, tree), distances = self._amenities.sindex.nearest(location["geometry"], return_all=False, exclusive=True,
+                                                              return_distance=True)
+        if len(tree) == 0:
+            return None, None
+        return self._amenities.iloc[tree[0]], distances[0]
 
     def intersects_other_locations(self, place: Series) -> List[Series]:
-        p = place['geometry']
-
-        if isinstance(p, Polygon):
-            p = get_center_of_polygon(place)
-
-        potential_matches_idx = list(self._buildings.sindex.query(p, predicate='intersects'))
-        intersections = [self._buildings.iloc[idx] for idx in potential_matches_idx
-                         if self._buildings.geometry.iloc[idx].contains(p)]
+        positions = self._buildings.sindex.query(representative_point(place["geometry"]), predicate="within")
+        return [self._buildings.iloc[idx] for idx in np.sort(positions)]
+
+    @cached_property
+    def _first_position_by_name(self) -> Dict[str, int]:
+        names = self._amenities["name"].to_numpy()
+        return {name: position for position, name in reversed(list(enumerate(names)))}
+
+    @cached_property
+    def _first_position_by_osm_id(self) -> Dict[int, int]:
+        if "id" not in self._amenities.columns:
+            return {}
+        osm_ids = self._amenities["id"].to_numpy()
+        return {int(osm_id): position for position, osm_id in reversed(list(enumerate(osm_ids)))}
+
+    def _resolve_place(self, name: Optional[str] = None, osm_id: Optional[int] = None,
+                       lat: Optional[float] = None, lon: Optional[float] = None,
+                       position: Optional[int] = None) -> Tuple[Any, Optional[int]]:
+        if position is not None:
+            position = position if 0 <= position < len(self._amenities) else None
+        elif name is not None:
+            position = self._first_position_by_name.get(name)
+        elif osm_id is not None:
+            position = self._first_position_by_osm_id.get(osm_id)
+        elif lat is not None and lon is not None:
+            point = self.projection.project_lonlat(lon, lat)
+            # Coordinates far outside the city's UTM zone project to inf and cannot be matched to anything.
+            return (point, None) if np.isfinite([point.x, point.y]).all() else (None, None)
+
+        if position is None:
+            return None, None
+        return self._amenities.geometry.iloc[position], position
+
+    def nearest_batch(self, places: List[Dict[str, Any]], *, meters: float = 500) -> List[Dict[str, Any]]:
+        """Nearest street, nearest other amenity, amenities within ``meters`` and containing buildings for many places.
+
+        Each place is a dict with ``name``, ``osm_id``, ``lat``/``lon`` or an amenity ``position``; all relationships
+        come from vectorized spatial-index queries, and ``nearby`` and ``intersections`` are frame slices. Unknown
+        places, and places with no street to match (e.g. a city without edges), yield an entry with only an ``error``
+        key.
+        """
+        resolved = [self._resolve_place(**place) for place in places]
+        found = [i for i, (geometry, _) in enumerate(resolved) if geometry is not None]
+        results: List[Dict[str, Any]] = [{"error": "Location not found"} for _ in places]
+        if not found:
+            return results
+
+        geometries = np.array([resolved[i][0] for i in found], dtype=object)
+        points = np.array([self.amenity_points[resolved[i][1]] if resolved[i][1] is not None
+                           else resolved[i][0] for i in found], dtype=object)
+
+        street_input, street_tree = self._edges.sindex.nearest(points, return_all=False)
+        location_pairs, location_distances = self._amenities.sindex.nearest(
+            geometries, return_all=False, exclusive=True, return_distance=True)
+        nearby_input, nearby_tree = self._amenities.sindex.query(geometries, predicate="dwithin", distance=meters)
+        building_input, building_tree = self._buildings.sindex.query(points, predicate="within")
+
+        streets = dict(zip(street_input.tolist(), street_tree.tolist()))
+        locations = {i: (tree, distance) for i, tree, distance in zip(*location_pairs, location_distances)}
+        names = self._amenities["name"].to_numpy()
+
+        for i, place_index in enumerate(found):
+            if i not in streets:
+                continue
+            geometry, position = resolved[place_index]
+            name = names[position] if position is not None else None
+            street = self._edges.iloc[streets[i]]
+            location, location_distance = locations.get(i, (None, None))
+            nearby = nearby_tree[(nearby_input == i) & (names[nearby_tree] != name)]
+
+            results[place_index] = {
+                "place": self._amenities.iloc[position] if position is not None else None,
+                "street": street,
+                "street_distance": street.geometry.distance(geometry),
+                "location": self._amenities.iloc[location] if location is not None else None,
+                "location_distance": location_distance,
+                "nearby": self._amenities.iloc[nearby],
+                "intersections": self._buildings.iloc[building_tree[building_input == i]],
+            }
 
-        return intersections
+        return results
 
-    def ai_anomaly_response(self, percent: float = 0.05, nsmallest: int = 5) -> GeoDataFrame:
-        anomalies = self._amenities.merge(self._anomalies_detected(self._amenities, percent=percent), on="name", how="left").nsmallest(nsmallest, "anomaly_score")
-        return _CLAUDE_CLIENT.build_response(anomalies)
+    @property
+    def assessments(self) -> Dict[Tuple[float, int], GeoDataFrame]:
+        """Full-quality assessments computed so far, keyed by ``(percent, nsmallest)``."""
+        return dict(self._assessments)
+
+    def assessment_version(self, percent: float = 0.05, nsmallest: int = 5) -> str:
+        """Identifies the full-quality ``ai_anomaly_response`` of this snapshot, e.g. for ETags."""
+        parts = [self.snapshot, pipeline_version(), str(percent), str(nsmallest)]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def _plan_detection(self, deadline: Deadline) -> Tuple[DataFrame, int]:
+        """Pick the amenities and forest size that fit in the detector's share of the remaining deadline."""
+        budget = deadline.remaining() * _DETECTOR_SHARE
+        rows = len(self._amenities)
+
+        if STAGE_COSTS.estimate("isolation_forest", rows) <= budget:
+            return self._amenities, _FULL_FOREST
+
+        deadline.degrade(FAST_DETECTOR)
+        per_row = STAGE_COSTS.estimate("isolation_forest") * _FAST_FOREST / _FULL_FOREST
+        sample_size = max(_MIN_SAMPLE, int(budget / per_row))
+        if sample_size >= rows:
+            return self._amenities, _FAST_FOREST
+
+        deadline.degrade(SAMPLED_SUBSET)
+        return self._amenities.sample(n=sample_size, random_state=_RANDOM_STATE), _FAST_FOREST
+
+    def ai_anomaly_response(self, percent: float = 0.05, nsmallest: int = 5,
+                            progress: ProgressCallback = _no_progress,
+                            deadline: Optional[Deadline] = None,
+                            preview: PreviewCallback = _no_preview) -> GeoDataFrame:
+        """Score the amenities and assess the ``nsmallest`` most anomalous ones.
+
+        With a ``deadline``, the detector may run a smaller forest or score a random sample, and the LLM may be
+        skipped in favour of model-only assessments; each such degradation is recorded on the deadline. Before the
+        LLM is called, ``preview`` receives the anomalies with model-only assessments in place of its answers.
+        """
+        # Assessments are kept for the lifetime of this snapshot, so repeat requests skip detection and the LLM.
+        cached = self._assessments.get((percent, nsmallest))
+        if cached is not None:
+            return cached.copy()
+
+        progress(PIPELINE_STAGES[3])
+        amenities, n_estimators = self._plan_detection(deadline) if deadline is not None else \
+            (self._amenities, _FULL_FOREST)
+        scores = self._anomalies_detected(amenities, percent=percent, n_estimators=n_estimators)
+        anomalies = amenities.join(scores[ANOMALY_HEADERS[1:]]).nsmallest(nsmallest, "anomaly_score")
+        progress(PIPELINE_STAGES[4])
+        with stage("triage", rows=len(anomalies)):
+            decided, ambiguous = triage_anomalies(anomalies)
+
+        if len(ambiguous) > 0:
+            if deadline is not None and deadline.remaining() < STAGE_COSTS.estimate("llm"):
+                deadline.degrade(SKIPPED_LLM)
+                ambiguous = model_only_assessments(ambiguous)
+            else:
+                preview(concat([decided, model_only_assessments(ambiguous, PENDING_LLM_EXPLANATION)])
+                        .loc[anomalies.index])
+                start = time.perf_counter()
+                ambiguous = get_claude_client().build_response(ambiguous)
+                ambiguous[ASSESSMENT_HEADERS[3]] = LLM_SOURCE
+                STAGE_COSTS.record("llm", time.perf_counter() - start)
+
+        assessed = concat([decided, ambiguous]).loc[anomalies.index]
+        if deadline is None or not deadline.degradations:
+            self._assessments[(percent, nsmallest)] = assessed
+        return assessed.copy()
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional, Callable, Iterator, TYPE_CHECKING
+
+from server.api import settings
+from server.api.deadline import STAGE_COSTS
+from server.api.metrics import METRICS
+from server.api.shared_cache import SharedCityStore, get_shared_store
+
+if TYPE_CHECKING:
+    from server.api.anomaly_detection import CityData
+
+_LOGGER = logging.getLogger(__name__)
+
+METRICS.describe("city_cache_hits_total", "CityData lookups served from the in-process cache.")
+METRICS.describe("city_cache_misses_total", "CityData lookups that had to build the city.")
+
+
+def normalize_city(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+
+class CityCache:
+    """LRU of built CityData keyed by normalized city name; concurrent builds of one city share a lock.
+
+    With a shared store, misses first load what another worker process already built, and builds are coordinated
+    across processes so each city is built once per host.
+    """
+
+    def __init__(self, max_cities: int = settings.CITY_CACHE_SIZE, ttl: float = settings.CITY_CACHE_TTL,
+                 store: Optional[SharedCityStore] = None) -> None:
+        self._max_cities = max_cities
+        self._ttl = ttl
+        self._store = store
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Tuple[float, 'CityData']] = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    def _lookup(self, key: str) -> Optional['CityData']:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            built, city_data = entry
+            if time.time() - built > self._ttl:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return city_data
+
+    def contains(self, city: str) -> bool:
+        return self._lookup(normalize_city(city)) is not None
+
+    def peek(self, city: str) -> Optional['CityData']:
+        return self._lookup(normalize_city(city))
+
+    def is_warm(self, city: str) -> bool:
+        """Whether a request for ``city`` can be served without downloading and building it."""
+        key = normalize_city(city)
+        return self._lookup(key) is not None or (self._store is not None and self._store.has(key))
+
+    def put(self, city: str, city_data: 'CityData') -> None:
+        with self._lock:
+            self._entries[normalize_city(city)] = (time.time(), city_data)
+            self._entries.move_to_end(normalize_city(city))
+            while len(self._entries) > self._max_cities:
+                self._entries.popitem(last=False)
+
+    @contextmanager
+    def _building(self, key: str) -> Iterator[None]:
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            yield
+
+        with self._lock:
+            self._build_locks.pop(key, None)
+
+    def get(self, city: str, progress: Callable[[str], None] = lambda _: None) -> 'CityData':
+        """The cached city, loading another worker's snapshot or building it on a miss; ``progress`` gets the
+        build's pipeline stages."""
+        key = normalize_city(city)
+
+        city_data = self._lookup(key)
+        if city_data is not None:
+            METRICS.increment("city_cache_hits_total")
+            return city_data
+
+        with self._building(key):
+            # Another request may have finished building this city while we waited for the lock.
+            city_data = self._lookup(key)
+            if city_data is not None:
+                METRICS.increment("city_cache_hits_total")
+                return city_data
+
+            METRICS.increment("city_cache_misses_total")
+            city_data = self._build(city, key, progress=progress)
+            self.put(city, city_data)
+
+        return city_data
+
+    @staticmethod
+    def _download(city: str, progress: Callable[[str], None]) -> 'CityData':
+        from server.api.anomaly_detection import CityData
+
+        start = time.perf_counter()
+        city_data = CityData.from_location(city, progress=progress)
+        # Deadline requests compare this with their budget before waiting on a cold build.
+        STAGE_COSTS.record("city_build", time.perf_counter() - start)
+        return city_data
+
+    def _build(self, city: str, key: str, max_age: Optional[float] = None,
+               progress: Callable[[str], None] = lambda _: None) -> 'CityData':
+        if self._store is None:
+            return self._download(city, progress)
+
+        while True:
+            city_data = self._store.load(key, max_age=max_age)
+            if city_data is not None:
+                return city_data
+            if self._store.claim(key, city):
+                break
+            # Another worker is building this city; its snapshot becomes loadable once it finishes.
+            time.sleep(settings.SHARED_CACHE_POLL)
+
+        try:
+            city_data = self._download(city, progress)
+            try:
+                self._store.save(key, city, city_data)
+            except Exception:
+                # The snapshot only spares other workers a build; this one still serves what it built.
+                _LOGGER.exception("Could not save %s to the shared city store", city)
+        finally:
+            self._store.release(key)
+
+        return city_data
+
+    def refresh(self, city: str, prepare: Callable[['CityData'], None] = lambda _: None,
+                max_age: float = 0) -> 'CityData':
+        """Rebuild a city from a fresh OSM snapshot and swap it in once ``prepare`` has warmed it.
+
+        A shared snapshot younger than ``max_age`` seconds, e.g. one another worker just refreshed, is reused.
+        Requests keep being served from the previous entry while the rebuild runs.
+        """
+        key = normalize_city(city)
+
+        with self._building(key):
+            city_data = self._build(city, key, max_age=max_age)
+            prepare(city_data)
+            self.share_assessments(city, city_data)
+            self.put(city, city_data)
+
+        return city_data
+
+    def share_assessments(self, city: str, city_data: 'CityData') -> None:
+        """Store assessments computed in this process with the shared snapshot, so other workers reuse them."""
+        if self._store is not None:
+            self._store.save_assessments(normalize_city(city), city_data)
+
+
+CITY_CACHE = CityCache(store=get_shared_store())
@@ -1,12 +1,16 @@
+import hashlib
 import json
 from typing import List, Union, Dict
 
-from anthropic import Client, HUMAN_PROMPT, AI_PROMPT
-from anthropic.types import TextBlock
 from geopandas.geodataframe import GeoDataFrame
 from pandas import DataFrame
 
 from server.api.constants import DATA_HEADERS
+from server.api.llm_backend import LLMBackend
+from server.api.metrics import stage
+
+_HUMAN_PROMPT = "\n\nHuman:"
+_AI_PROMPT = "\n\nAssistant:"
 
 _SYSTEM_PROMPT = f"""
         You are a geospatial data quality assistant.
@@ -29,10 +33,13 @@ _SYSTEM_PROMPT = f"""
         - i = {DATA_HEADERS[4]}, its position intersects multiple buildings
 """
 
+# Changes whenever the prompt text does, so cached assessments and ETags built from an older prompt are invalidated.
+PROMPT_VERSION = hashlib.sha256(_SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
 
 class ClaudeClient:
-    def __init__(self, client: Client) -> None:
-        self._client = client
+    def __init__(self, backend: LLMBackend) -> None:
+        self._backend = backend
 
     @staticmethod
     def _user_prompt(features_json: List[Dict[str, Union[int, float]]]) -> str:
@@ -42,28 +49,6 @@ class ClaudeClient:
         {features_json}
         """
 
-    def _send_message(self, prompt: str) -> List[TextBlock]:
-        tokens_cost = self._client.messages.count_tokens(
-            model="claude-opus-4-6",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-        )
-        message = self._client.messages.create(
-            model="claude-opus-4-6",
-            max_tokens=500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-        )
-        return message.content
-
     def append_explanations(self, anomaly_frame: GeoDataFrame) -> GeoDataFrame:
         claude_data = GeoDataFrame(
             self.explain_anomalies(anomaly_frame[DATA_HEADERS + ['geometry']].to_geo_dict()['features']))
@@ -88,9 +73,10 @@ class ClaudeClient:
     def build_response(self, anomalies: GeoDataFrame) -> GeoDataFrame:
         anomaly_data = self.parse_anomaly_data(anomalies)
 
-        response = self._send_message(
-            f"{_SYSTEM_PROMPT}\n\n{HUMAN_PROMPT} {self._user_prompt(anomaly_data)} {AI_PROMPT}")
-        ai_assessments = json.loads(response[0].text.replace("json", "").replace("`", ""))
+        with stage("llm", rows=len(anomaly_data)):
+            response = self._backend.complete(
+                f"{_SYSTEM_PROMPT}\n\n{_HUMAN_PROMPT} {self._user_prompt(anomaly_data)} {_AI_PROMPT}", anomaly_data)
+        ai_assessments = json.loads(response.replace("json", "").replace("`", ""))
 
         assessments_df = DataFrame(ai_assessments, index=anomalies.index)
         return anomalies.join(assessments_df)
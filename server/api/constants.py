@@ -4,6 +4,9 @@ LOCATION_TAGS = {
 }
 DATA_HEADERS = ['name', 'Meters From Street', 'Meters from Location', 'Density', 'Building Intersections']
 ANOMALY_HEADERS = ['name', 'anomaly_score', 'is_anomaly']
+ASSESSMENT_HEADERS = ['risk_level', 'explanation', 'suggested_check', 'assessment_source']
+PIPELINE_STAGES = ['download', 'project', 'features', 'detect', 'assess']
+EXPORT_LAYERS = ['dataset', 'edges', 'buildings', 'amenities']
 COUNTRY_CODES = [
     "AFG",
     "ALB",
@@ -0,0 +1,54 @@
+import threading
+import time
+from typing import Dict, List
+
+from server.api.metrics import METRICS
+
+SKIPPED_LLM = "skipped_llm"
+FAST_DETECTOR = "fast_detector"
+SAMPLED_SUBSET = "sampled_subset"
+
+METRICS.describe("deadline_degradations_total", "Degradations applied to meet a request deadline.")
+METRICS.describe("deadline_cold_builds_total", "Deadline requests answered 503 while their cold city is built.")
+
+# Weight given to the latest observation when updating a stage's cost estimate.
+_COST_SMOOTHING = 0.3
+
+
+class Deadline:
+    """Time budget for one request, and the degradations applied so far to stay within it."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self._expires = time.monotonic() + seconds
+        self.degradations: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires - time.monotonic())
+
+    def degrade(self, degradation: str) -> None:
+        if degradation not in self.degradations:
+            self.degradations.append(degradation)
+            METRICS.increment("deadline_degradations_total", degradation=degradation)
+
+
+class StageCosts:
+    """Moving averages of seconds per unit of work for the stages a deadline can cut short."""
+
+    def __init__(self, priors: Dict[str, float]) -> None:
+        self._lock = threading.Lock()
+        self._per_unit = dict(priors)
+
+    def estimate(self, stage: str, units: float = 1) -> float:
+        with self._lock:
+            return self._per_unit[stage] * units
+
+    def record(self, stage: str, seconds: float, units: float = 1) -> None:
+        if units <= 0:
+            return
+        with self._lock:
+            self._per_unit[stage] += _COST_SMOOTHING * (seconds / units - self._per_unit[stage])
+
+
+# isolation_forest is per amenity for a 100-tree forest, llm is per call and city_build per cold city download and build.
+STAGE_COSTS = StageCosts({"isolation_forest": 3e-5, "llm": 8.0, "city_build": 60.0})
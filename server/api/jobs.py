@@ -0,0 +1,250 @@
+import functools
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Any, Tuple
+
+from server.api import settings
+from server.api.admission import AdmissionController, Ticket
+from server.api.city_cache import normalize_city
+from server.api.constants import PIPELINE_STAGES
+from server.api.metrics import METRICS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_worker_progress = None
+
+METRICS.describe("jobs_coalesced_total", "Job submissions answered with a job already running for the same city.")
+
+
+def _init_worker(progress_queue) -> None:
+    global _worker_progress
+    _worker_progress = progress_queue
+
+
+def _run_anomaly_job(job_id: str, city: str, percent: float, nsmallest: int) -> str:
+    from server.api.city_cache import CITY_CACHE
+
+    # Tells the queue a worker picked the job up, so it is not resubmitted if the pool breaks later.
+    _worker_progress.put((job_id, None, None))
+
+    def progress(stage: str) -> None:
+        _worker_progress.put((job_id, stage, None))
+
+    def preview(assessed) -> None:
+        _worker_progress.put((job_id, None, assessed.to_crs(epsg=4326).to_json()))
+
+    # Through the worker's city cache, a job loads a snapshot another process already built, and what it builds and
+    # assesses is saved for the server and the other workers, e.g. the map's /layers requests that follow.
+    city_data = CITY_CACHE.get(city, progress=progress)
+    assessed = city_data.ai_anomaly_response(percent=percent, nsmallest=nsmallest, progress=progress,
+                                             preview=preview)
+    CITY_CACHE.share_assessments(city, city_data)
+    return assessed.to_crs(epsg=4326).to_json()
+
+
+@dataclass
+class Job:
+    id: str
+    city: str
+    status: str = QUEUED
+    stage: Optional[str] = None
+    result: Optional[str] = None
+    # Provisional model-only anomalies, published while the LLM assesses the final result.
+    partial: Optional[str] = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = PIPELINE_STAGES.index(self.stage) if self.stage in PIPELINE_STAGES else 0
+        if self.status == DONE:
+            completed = len(PIPELINE_STAGES)
+
+        return {
+            "id": self.id,
+            "city": self.city,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": PIPELINE_STAGES,
+            "progress": completed / len(PIPELINE_STAGES),
+            "error": self.error,
+            "result": json.loads(self.result) if self.result is not None else None,
+            "partial": json.loads(self.partial) if self.partial is not None and self.result is None else None,
+        }
+
+
+class JobQueue:
+    """Runs the CityData pipeline in a local process pool and tracks stage progress per job.
+
+    Submissions for a city and parameters that already have an unfinished job get that job. New jobs for cold cities
+    go through ``admission``, whose ticket is held until the job finishes.
+    """
+
+    def __init__(self, max_workers: int = settings.JOB_WORKERS, ttl: float = settings.JOB_TTL,
+                 admission: Optional[AdmissionController] = None) -> None:
+        self._max_workers = max_workers
+        self._ttl = ttl
+        self._admission = admission
+        self._jobs: Dict[str, Job] = {}
+        self._inflight: Dict[Tuple[str, float, int], str] = {}
+        self._tickets: Dict[str, Optional[Ticket]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._progress = None
+        self._listener: Optional[threading.Thread] = None
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                if self._progress is None:
+                    self._progress = context.Queue()
+                    self._listener = threading.Thread(target=self._listen, args=(self._progress,), name="job-progress",
+                                                      daemon=True)
+                    self._listener.start()
+                self._executor = ProcessPoolExecutor(max_workers=self._max_workers, mp_context=context,
+                                                     initializer=_init_worker, initargs=(self._progress,))
+
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken pool so the next submission starts a fresh one; the progress listener is kept."""
+        with self._pool_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, job_id: str, args: tuple, resubmitted: bool = False) -> None:
+        executor = self._ensure_started()
+        try:
+            future = executor.submit(_run_anomaly_job, job_id, *args)
+        except BrokenProcessPool:
+            # A worker died after the last submission, which leaves the whole pool unusable.
+            self._discard(executor)
+            executor = self._ensure_started()
+            future = executor.submit(_run_anomaly_job, job_id, *args)
+
+        future.add_done_callback(functools.partial(self._finish, job_id, executor, args, resubmitted))
+
+    def _listen(self, progress) -> None:
+        while True:
+            message = progress.get()
+            if message is None:
+                return
+
+            job_id, stage, partial = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job.status in (QUEUED, RUNNING):
+                    job.status = RUNNING
+                    if stage is not None:
+                        job.stage = stage
+                    if partial is not None:
+                        job.partial = partial
+
+    def _finish(self, job_id: str, executor: ProcessPoolExecutor, args: tuple, resubmitted: bool,
+                future: Future) -> None:
+        broken = not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+        if broken:
+            self._discard(executor)
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+
+            # When a worker dies, every job of its pool fails with it. Jobs no worker had started yet are not to
+            # blame, so they get one more try on a fresh pool; the running ones fail.
+            retry = broken and job.status == QUEUED and not resubmitted
+            if not retry:
+                key = (normalize_city(args[0]), *args[1:])
+                if self._inflight.get(key) == job_id:
+                    del self._inflight[key]
+                # Released before the job reads as finished, so a client that saw it finish is admitted again.
+                ticket = self._tickets.pop(job_id, None)
+                if self._admission is not None:
+                    self._admission.release(ticket)
+                self._record(job, future)
+
+        if retry:
+            self._dispatch(job_id, args, resubmitted=True)
+
+    @staticmethod
+    def _record(job: Job, future: Future) -> None:
+        job.finished = time.time()
+        try:
+            job.result = future.result()
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and now - job.finished > self._ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _running(self, key: Tuple[str, float, int]) -> Optional[Job]:
+        job_id = self._inflight.get(key)
+        return self._jobs.get(job_id) if job_id is not None else None
+
+    def submit(self, city: str, *, percent: float = 0.05, nsmallest: int = 5, client: str = "unknown") -> Job:
+        """Queue a job, or return the unfinished one for the same city and parameters.
+
+        Raises the admission controller's ``HTTPException`` when a cold city cannot be taken on now.
+        """
+        self._evict_expired()
+        key = (normalize_city(city), percent, nsmallest)
+
+        with self._lock:
+            running = self._running(key)
+        if running is not None:
+            METRICS.increment("jobs_coalesced_total")
+            return running
+
+        ticket = self._admission.acquire(city, client, background=True) if self._admission is not None else None
+
+        with self._lock:
+            # Another submission for this city may have been admitted while this one was geocoding.
+            running = self._running(key)
+            if running is None:
+                job = Job(id=uuid.uuid4().hex, city=city)
+                self._jobs[job.id] = job
+                self._inflight[key] = job.id
+                self._tickets[job.id] = ticket
+
+        if running is not None:
+            if self._admission is not None:
+                self._admission.release(ticket)
+            METRICS.increment("jobs_coalesced_total")
+            return running
+
+        self._dispatch(job.id, (city, percent, nsmallest))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            executor, self._executor = self._executor, None
+            progress, self._progress = self._progress, None
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if progress is not None:
+            progress.put(None)
@@ -0,0 +1,66 @@
+import json
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from geopandas import GeoDataFrame, GeoSeries
+from shapely import box
+
+_CHUNK_ROWS = 500
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    if bbox is None:
+        return None
+
+    try:
+        min_x, min_y, max_x, max_y = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be 'min_lon,min_lat,max_lon,max_lat'")
+
+    return min_x, min_y, max_x, max_y
+
+
+def parse_columns(frame: GeoDataFrame, columns: Optional[str]) -> Optional[List[str]]:
+    if columns is None:
+        return None
+
+    selected = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in selected if column not in frame.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {unknown}")
+
+    return [column for column in selected if column != frame.geometry.name]
+
+
+def select_positions(frame: GeoDataFrame, bbox: Optional[Tuple[float, float, float, float]]) -> np.ndarray:
+    """Positional indices of rows intersecting a WGS84 bbox, found through the frame's spatial index."""
+    if bbox is None:
+        return np.arange(len(frame))
+
+    query = GeoSeries([box(*bbox)], crs="EPSG:4326").to_crs(frame.crs).iloc[0]
+    return np.sort(frame.sindex.query(query, predicate="intersects"))
+
+
+def paginate(positions: np.ndarray, cursor: Optional[int], limit: int) -> Tuple[np.ndarray, Optional[int]]:
+    """Cursors are frame positions, so pages stay stable while other filters change."""
+    if cursor is not None:
+        positions = positions[positions >= cursor]
+
+    next_cursor = int(positions[limit]) if len(positions) > limit else None
+    return positions[:limit], next_cursor
+
+
+def page_frame(frame: GeoDataFrame, positions: np.ndarray, columns: Optional[List[str]]) -> GeoDataFrame:
+    page = frame.iloc[positions]
+    if columns is not None:
+        page = page[columns + [frame.geometry.name]]
+
+    return page.to_crs(epsg=4326)
+
+
+def iter_ndjson(frame: GeoDataFrame, positions: np.ndarray, columns: Optional[List[str]]) -> Iterator[bytes]:
+    for start in range(0, len(positions), _CHUNK_ROWS):
+        chunk = page_frame(frame, positions[start:start + _CHUNK_ROWS], columns)
+        yield b"".join(json.dumps(feature, default=str).encode() + b"\n"
+                       for feature in chunk.iterfeatures(na="null"))
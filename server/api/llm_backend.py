@@ -0,0 +1,85 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import List, Dict, Union, Optional
+
+from server.api import settings
+
+
+class LLMBackend(ABC):
+    """Sends a fully built prompt to a language model and returns the raw text reply."""
+
+    @abstractmethod
+    def complete(self, prompt: str, anomaly_data: List[Dict[str, Union[int, float]]]) -> str:
+        ...
+
+
+class AnthropicBackend(LLMBackend):
+    def __init__(self, client=None, *, model: str = settings.LLM_MODEL, max_tokens: int = 500) -> None:
+        if client is None:
+            # Honours ANTHROPIC_API_KEY and ANTHROPIC_BASE_URL, so a local stub server can stand in for the API.
+            import anthropic
+            client = anthropic.Anthropic()
+
+        self._client = client
+        self._model = model
+        self._max_tokens = max_tokens
+
+    def complete(self, prompt: str, anomaly_data: List[Dict[str, Union[int, float]]]) -> str:
+        messages = [
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ]
+        self._client.messages.count_tokens(model=self._model, messages=messages)
+        message = self._client.messages.create(model=self._model, max_tokens=self._max_tokens, messages=messages)
+
+        return message.content[0].text
+
+
+class FakeBackend(LLMBackend):
+    """Offline stand-in returning schema-valid assessments derived from the features, after ``latency`` seconds."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self._latency = latency
+
+    @staticmethod
+    def _assess(features: Dict[str, Union[int, float]]) -> Dict[str, str]:
+        street_distance = float(features.get("l") or 0)
+        intersections = int(features.get("i") or 0)
+
+        if street_distance > 250:
+            return {
+                "risk_level": "high",
+                "explanation": f"Located {street_distance:.0f} m from the nearest drivable road.",
+                "suggested_check": "Verify coordinates against satellite imagery.",
+            }
+        if intersections > 1:
+            return {
+                "risk_level": "medium",
+                "explanation": f"Point lies inside {intersections} overlapping building footprints.",
+                "suggested_check": "Check for duplicate or overlapping building polygons.",
+            }
+        return {
+            "risk_level": "low",
+            "explanation": "Feature values are only mildly unusual for this city.",
+            "suggested_check": "Confirm the name and category tags are current.",
+        }
+
+    def complete(self, prompt: str, anomaly_data: List[Dict[str, Union[int, float]]]) -> str:
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+        return json.dumps([self._assess(features) for features in anomaly_data])
+
+
+def get_llm_backend(name: Optional[str] = None) -> LLMBackend:
+    name = name or settings.LLM_BACKEND
+
+    if name == "anthropic":
+        return AnthropicBackend()
+    if name == "fake":
+        return FakeBackend(latency=settings.FAKE_LLM_LATENCY)
+
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -0,0 +1,165 @@
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, List, Optional, Iterator
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(labels: _Labels, **extra: str) -> str:
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+@dataclass
+class _Histogram:
+    buckets: List[int] = field(default_factory=lambda: [0] * len(_SECONDS_BUCKETS))
+    total: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(_SECONDS_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[_Labels, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[_Labels, _Histogram]] = defaultdict(lambda: defaultdict(_Histogram))
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._counters[name][tuple(sorted(labels.items()))] += amount
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._gauges[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._histograms[name][tuple(sorted(labels.items()))].observe(value)
+
+    def value(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters[name][tuple(sorted(labels.items()))]
+
+    def _header(self, name: str, kind: str) -> List[str]:
+        lines = [f"# HELP {name} {self._help[name]}"] if name in self._help else []
+        return lines + [f"# TYPE {name} {kind}"]
+
+    def render(self) -> str:
+        self.set_gauge("process_peak_rss_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.extend(self._header(name, "counter"))
+                lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(series.items()))
+
+            for name, series in sorted(self._gauges.items()):
+                lines.extend(self._header(name, "gauge"))
+                lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(series.items()))
+
+            for name, series in sorted(self._histograms.items()):
+                lines.extend(self._header(name, "histogram"))
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in zip(_SECONDS_BUCKETS, histogram.buckets):
+                        lines.append(f"{name}_bucket{_format_labels(labels, le=f'{bound:g}')} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+METRICS.describe("pipeline_stage_seconds", "Wall time spent in each pipeline stage.")
+METRICS.describe("pipeline_stage_rows_total", "Rows processed by each pipeline stage.")
+METRICS.describe("pipeline_stage_peak_memory_bytes", "Peak traced Python memory during the last run of each stage.")
+METRICS.describe("process_peak_rss_bytes", "Peak resident set size of this server process.")
+
+
+@dataclass
+class StageTiming:
+    name: str
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    peak_memory: Optional[int] = None
+
+
+class RequestTimings:
+    """Stage timings collected while serving one request, reported back in the Server-Timing header."""
+
+    def __init__(self) -> None:
+        self.stages: List[StageTiming] = []
+
+    def server_timing(self) -> str:
+        entries = []
+        for timing in self.stages:
+            entry = f"{timing.name};dur={timing.seconds * 1000:.1f}"
+            if timing.rows is not None:
+                entry += f';desc="rows={timing.rows}"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+_REQUEST_TIMINGS: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def track_request() -> Iterator[RequestTimings]:
+    timings = RequestTimings()
+    token = _REQUEST_TIMINGS.set(timings)
+    try:
+        yield timings
+    finally:
+        _REQUEST_TIMINGS.reset(token)
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[StageTiming]:
+    """Time a pipeline stage; callers may set ``rows`` on the yielded timing once the row count is known.
+
+    Peak memory is only recorded while tracemalloc is tracing, and is approximate when stages overlap.
+    """
+    timing = StageTiming(name=name, rows=rows)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.seconds = time.perf_counter() - start
+        METRICS.observe("pipeline_stage_seconds", timing.seconds, stage=name)
+
+        if timing.rows is not None:
+            METRICS.increment("pipeline_stage_rows_total", timing.rows, stage=name)
+        if tracing:
+            timing.peak_memory = tracemalloc.get_traced_memory()[1]
+            METRICS.set_gauge("pipeline_stage_peak_memory_bytes", timing.peak_memory, stage=name)
+
+        request_timings = _REQUEST_TIMINGS.get()
+        if request_timings is not None:
+            request_timings.stages.append(timing)
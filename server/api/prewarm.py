@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from server.api import settings
+from server.api.admission import AdmissionController, ADMISSION
+from server.api.city_cache import CityCache, CITY_CACHE, normalize_city
+from server.api.metrics import METRICS
+
+_LOGGER = logging.getLogger(__name__)
+
+METRICS.describe("prewarm_refreshes_total", "Scheduled city refreshes by outcome.")
+METRICS.describe("prewarm_refresh_seconds", "Wall time of one scheduled city refresh.")
+
+
+class RequestPopularity:
+    """Sliding window of requested cities, used to pick which cities to keep warm."""
+
+    def __init__(self, window: float = settings.PREWARM_WINDOW) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._requests: Deque[Tuple[float, str]] = deque()
+        # The most recent spelling of each normalized city, so refreshes query Overpass with a real place name.
+        self._names: Dict[str, str] = {}
+
+    def _expire(self, now: float) -> None:
+        while self._requests and now - self._requests[0][0] > self._window:
+            self._requests.popleft()
+
+    def record(self, city: str) -> None:
+        key = normalize_city(city)
+        now = time.time()
+        with self._lock:
+            self._requests.append((now, key))
+            self._names[key] = city
+            self._expire(now)
+
+    def most_requested(self, n: int) -> List[str]:
+        with self._lock:
+            self._expire(time.time())
+            counts = Counter(key for _, key in self._requests)
+            return [self._names[key] for key, _ in counts.most_common(n)]
+
+
+def _warm_assessments(city_data) -> None:
+    city_data.scored_amenities
+    city_data.ai_anomaly_response()
+
+
+class PrewarmScheduler:
+    """Periodically rebuilds configured and popular cities in the city cache, a few at a time."""
+
+    def __init__(self, cache: CityCache, popularity: RequestPopularity, cities: List[str] = settings.PREWARM_CITIES,
+                 top_n: int = settings.PREWARM_TOP_N, interval: float = settings.PREWARM_INTERVAL,
+                 concurrency: int = settings.PREWARM_CONCURRENCY,
+                 admission: Optional[AdmissionController] = None) -> None:
+        self._cache = cache
+        self._admission = admission
+        self._popularity = popularity
+        self._cities = cities
+        self._top_n = top_n
+        self._interval = interval
+        self._concurrency = concurrency
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._cities) or self._top_n > 0
+
+    def targets(self) -> List[str]:
+        targets = {}
+        for city in self._cities + self._popularity.most_requested(self._top_n):
+            targets.setdefault(normalize_city(city), city)
+        return list(targets.values())
+
+    def _refresh(self, city: str) -> None:
+        start = time.perf_counter()
+        ticket = None
+        try:
+            if self._admission is not None:
+                # Refreshes are cold builds, so oversized cities are skipped and busy periods wait for the next
+                # round. Each city counts as its own client, since PREWARM_CONCURRENCY already bounds the scheduler.
+                ticket = self._admission.acquire(city, f"prewarm:{normalize_city(city)}", rebuild=True)
+            # Every worker runs a scheduler; the half-interval grace lets all but one reuse the shared snapshot.
+            self._cache.refresh(city, prepare=_warm_assessments, max_age=self._interval / 2)
+        except HTTPException as e:
+            METRICS.increment("prewarm_refreshes_total", outcome="skipped")
+            _LOGGER.info("Skipped pre-warming %s: %s", city, e.detail)
+        except Exception as e:
+            METRICS.increment("prewarm_refreshes_total", outcome="failed")
+            _LOGGER.warning("Pre-warming %s failed: %s", city, e)
+        else:
+            METRICS.increment("prewarm_refreshes_total", outcome="ok")
+        finally:
+            if self._admission is not None:
+                self._admission.release(ticket)
+        METRICS.observe("prewarm_refresh_seconds", time.perf_counter() - start)
+
+    def run_once(self) -> None:
+        with ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix="prewarm") as executor:
+            list(executor.map(self._refresh, self.targets()))
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self._interval)
+
+    def start(self) -> None:
+        if self._thread is None and self.enabled:
+            self._thread = threading.Thread(target=self._loop, name="prewarm-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        # A refresh already in progress is not interrupted; the daemon thread ends with the process.
+        self._stop.set()
+
+
+POPULARITY = RequestPopularity()
+PREWARM = PrewarmScheduler(CITY_CACHE, POPULARITY, admission=ADMISSION)
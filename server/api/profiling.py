@@ -0,0 +1,110 @@
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import re
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar, Iterator
+
+from fastapi import Request
+
+from server.api import settings
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_F = TypeVar("_F", bound=Callable)
+
+
+@dataclass
+class RequestProfile:
+    request_id: str
+    # Set once artifacts exist; a request that never reached profiled work, e.g. one coalesced onto another
+    # request's build, has nothing to point at.
+    written: bool = False
+
+
+_PROFILED_REQUEST: ContextVar[Optional[RequestProfile]] = ContextVar("profiled_request", default=None)
+
+
+def request_id_for(request: Request) -> str:
+    request_id = request.headers.get("x-request-id", "")
+    return request_id if _REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+
+
+def is_admin(request: Request) -> bool:
+    token = request.headers.get("x-admin-token", "")
+    return bool(settings.ADMIN_TOKEN) and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+def profile_requested(request: Request) -> bool:
+    if not settings.PROFILING_ENABLED or not is_admin(request):
+        return False
+    return request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+
+
+@contextmanager
+def request_profiling(request_id: Optional[str]) -> Iterator[Optional[RequestProfile]]:
+    profile = RequestProfile(request_id) if request_id is not None else None
+    token = _PROFILED_REQUEST.set(profile)
+    try:
+        yield profile
+    finally:
+        _PROFILED_REQUEST.reset(token)
+
+
+def artifact_path(request_id: str, suffix: str) -> Optional[str]:
+    if not _REQUEST_ID_PATTERN.match(request_id):
+        return None
+    return os.path.join(settings.PROFILE_DIR, f"{request_id}.{suffix}")
+
+
+def _write_artifacts(request_id: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot) -> None:
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(artifact_path(request_id, "prof"))
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+    report.write("\nTop allocations by line (tracemalloc):\n")
+    for statistic in snapshot.statistics("lineno")[:25]:
+        report.write(f"{statistic}\n")
+
+    with open(artifact_path(request_id, "txt"), "w") as file:
+        file.write(report.getvalue())
+
+
+def profiled(fn: _F) -> _F:
+    """Run ``fn`` under cProfile and tracemalloc when the current request opted into profiling.
+
+    cProfile only sees the calling thread, so this wraps the synchronous work itself rather than the async route.
+    tracemalloc is process-wide, so allocations from concurrent requests can show up in the report.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _PROFILED_REQUEST.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            _write_artifacts(profile.request_id, profiler, snapshot)
+            profile.written = True
+
+    return wrapper
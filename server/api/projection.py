@@ -0,0 +1,107 @@
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
+from networkx import MultiDiGraph
+from pyproj import CRS, Transformer
+from pyproj.aoi import AreaOfInterest
+from pyproj.database import query_utm_crs_info
+
+from server.api.metrics import stage
+
+WGS84 = CRS.from_epsg(4326)
+
+# Outside these latitudes UTM is undefined and the polar stereographic (UPS) zones are used, as osmnx does.
+_UTM_NORTH_LIMIT = 84
+_UTM_SOUTH_LIMIT = -80
+_UPS_NORTH = CRS.from_epsg(32661)
+_UPS_SOUTH = CRS.from_epsg(32761)
+
+
+@lru_cache(maxsize=64)
+def _transformer(source: CRS, target: CRS) -> Transformer:
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def metric_crs(bounds: Tuple[float, float, float, float]) -> CRS:
+    """UTM (or UPS) CRS for the centre of WGS84 ``bounds``, matching ``GeoSeries.estimate_utm_crs``."""
+    min_x, min_y, max_x, max_y = bounds
+    x_center, y_center = (min_x + max_x) / 2, (min_y + max_y) / 2
+
+    if y_center > _UTM_NORTH_LIMIT:
+        return _UPS_NORTH
+    if y_center < _UTM_SOUTH_LIMIT:
+        return _UPS_SOUTH
+
+    zones = query_utm_crs_info(datum_name="WGS 84", area_of_interest=AreaOfInterest(x_center, y_center,
+                                                                                    x_center, y_center))
+    return CRS.from_epsg(zones[0].code)
+
+
+class ProjectionContext:
+    """The metric CRS of one city and a cached transformer into it, shared by every layer.
+
+    Each layer is projected with a single vectorized transform over all of its coordinates and timed as its own
+    ``projection_<layer>`` stage.
+    """
+
+    def __init__(self, crs: CRS, source_crs: CRS = WGS84) -> None:
+        self.crs = CRS.from_user_input(crs)
+        self.source_crs = CRS.from_user_input(source_crs)
+        self._transformer = _transformer(self.source_crs, self.crs)
+
+    @classmethod
+    def for_city(cls, features: GeoDataFrame, graph: MultiDiGraph) -> 'ProjectionContext':
+        """Pick the CRS once from the extent of the features and street network together."""
+        source_crs = CRS.from_user_input(features.crs)
+        xs = np.fromiter((x for _, x in graph.nodes(data="x")), dtype=float, count=graph.number_of_nodes())
+        ys = np.fromiter((y for _, y in graph.nodes(data="y")), dtype=float, count=graph.number_of_nodes())
+
+        min_x, min_y, max_x, max_y = features.total_bounds
+        if len(xs) > 0:
+            min_x, min_y = np.nanmin([min_x, xs.min()]), np.nanmin([min_y, ys.min()])
+            max_x, max_y = np.nanmax([max_x, xs.max()]), np.nanmax([max_y, ys.max()])
+
+        bounds = (min_x, min_y, max_x, max_y)
+        if not source_crs.is_geographic:
+            bounds = _transformer(source_crs, WGS84).transform_bounds(*bounds)
+        return cls(metric_crs(bounds), source_crs)
+
+    def _transform_coordinates(self, coordinates: np.ndarray) -> np.ndarray:
+        x, y = self._transformer.transform(coordinates[:, 0], coordinates[:, 1])
+        return np.column_stack([x, y])
+
+    def project_geometries(self, geometries: np.ndarray) -> np.ndarray:
+        return shapely.transform(geometries, self._transform_coordinates)
+
+    def project_lonlat(self, lon: float, lat: float) -> shapely.Point:
+        return shapely.Point(*_transformer(WGS84, self.crs).transform(lon, lat))
+
+    def project_frame(self, frame: GeoDataFrame, layer: str) -> GeoDataFrame:
+        with stage(f"projection_{layer}", rows=len(frame)):
+            projected = frame.copy()
+            geometry = self.project_geometries(np.asarray(frame.geometry.values))
+            projected[frame.geometry.name] = GeoSeries(geometry, index=frame.index, crs=self.crs)
+            return projected
+
+    def project_graph(self, graph: MultiDiGraph) -> MultiDiGraph:
+        """Project node coordinates and edge geometries without osmnx's round trip through GeoDataFrames."""
+        with stage("projection_graph", rows=graph.number_of_nodes()):
+            projected = graph.copy()
+            nodes = list(projected.nodes.values())
+            if nodes:
+                coordinates = self._transform_coordinates(np.array([(node["x"], node["y"]) for node in nodes],
+                                                                   dtype=float))
+                for node, (x, y) in zip(nodes, coordinates.tolist()):
+                    node["x"], node["y"] = x, y
+
+            edges = [data for _, _, data in projected.edges(data=True) if "geometry" in data]
+            if edges:
+                geometries = self.project_geometries(np.array([data["geometry"] for data in edges], dtype=object))
+                for data, geometry in zip(edges, geometries):
+                    data["geometry"] = geometry
+
+            projected.graph["crs"] = self.crs
+            return projected
@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import io
+import json
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from fastapi import HTTPException, Request, Response
+
+from server.api.metrics import stage
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GEOJSON = "application/geo+json"
+ARROW = "application/vnd.apache.arrow.stream"
+FLATGEOBUF = "application/flatgeobuf"
+
+FORMATS = {
+    "geojson": GEOJSON,
+    "arrow": ARROW,
+    "fgb": FLATGEOBUF,
+}
+
+_MIN_COMPRESS_BYTES = 1024
+_VARY = "Accept, Accept-Encoding"
+
+
+def _media_types(header: str) -> list:
+    return [part.split(";")[0].strip().lower() for part in header.split(",") if part.strip()]
+
+
+def negotiate_format(request: Request, format: Optional[str] = None) -> str:
+    if format is not None:
+        if format not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of {list(FORMATS)}")
+        return FORMATS[format]
+
+    for media_type in _media_types(request.headers.get("accept", "")):
+        if media_type in FORMATS.values():
+            return media_type
+
+    return GEOJSON
+
+
+def reduce_precision(frame: 'GeoDataFrame', precision: Optional[int]) -> 'GeoDataFrame':
+    if precision is None:
+        return frame
+
+    import shapely
+
+    # Pointwise rounding keeps every geometry; the default mode drops footprints smaller than the grid as empty.
+    return frame.set_geometry(shapely.set_precision(frame.geometry.values, 10 ** -precision, mode="pointwise"))
+
+
+def encode_frame(frame: 'GeoDataFrame', media_type: str, members: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode ``frame``; ``members`` become GeoJSON foreign members, or Arrow schema metadata, of the collection."""
+    if media_type == ARROW:
+        import pyarrow
+
+        try:
+            table = frame.to_arrow(geometry_encoding="geoarrow")
+        except ValueError:
+            # Native GeoArrow needs a single geometry type, mixed layers fall back to geoarrow.wkb.
+            table = frame.to_arrow(geometry_encoding="WKB")
+
+        table = pyarrow.table(table)
+        if members:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                   **{key.encode(): json.dumps(value).encode()
+                                                      for key, value in members.items()}})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    if media_type == FLATGEOBUF:
+        buffer = io.BytesIO()
+        frame.to_file(buffer, driver="FlatGeobuf", engine="pyogrio")
+        return buffer.getvalue()
+
+    geojson = frame.to_json()
+    if members:
+        # Spliced in after the opening brace rather than re-parsing a potentially large FeatureCollection.
+        geojson = "{" + json.dumps(members)[1:-1] + ", " + geojson[1:]
+    return geojson.encode()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    encodings = _media_types(accept_encoding)
+
+    if "br" in encodings and brotli is not None:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    if len(body) < _MIN_COMPRESS_BYTES:
+        return body, None
+
+    encoding = negotiate_encoding(accept_encoding)
+
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6), "gzip"
+
+    return body, None
+
+
+def entity_tag(request: Request, version: str, format: Optional[str] = None, precision: Optional[int] = None) -> str:
+    """Strong ETag for one representation of versioned content.
+
+    Encoding is deterministic, so the version plus everything the request negotiates pins down the exact bytes.
+    """
+    parts = [version, negotiate_format(request, format), str(precision),
+             negotiate_encoding(request.headers.get("accept-encoding", "")) or "identity"]
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+
+    # If-None-Match uses weak comparison, so a W/ prefix added by an intermediary still matches.
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag not in candidates and "*" not in candidates:
+        return None
+
+    return Response(status_code=304, headers={"ETag": etag, "Vary": _VARY, "Cache-Control": "no-cache"})
+
+
+def frame_response(frame: 'GeoDataFrame', request: Request, *, format: Optional[str] = None,
+                   precision: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                   members: Optional[Dict[str, Any]] = None, version: Optional[str] = None,
+                   cacheable: bool = True) -> Response:
+    """Encode and compress ``frame`` for the request.
+
+    Cacheable responses carry an ETag, derived from ``version`` when the content is versioned or from the encoded
+    body otherwise, and a matching ``If-None-Match`` gets an empty 304 instead.
+    """
+    media_type = negotiate_format(request, format)
+    etag = entity_tag(request, version, format, precision) if cacheable and version is not None else None
+    if etag is not None and (response := not_modified(request, etag)) is not None:
+        return response
+
+    with stage("encode", rows=len(frame)):
+        body = encode_frame(reduce_precision(frame, precision), media_type, members)
+
+    if cacheable and etag is None:
+        etag = entity_tag(request, hashlib.sha256(body).hexdigest(), format, precision)
+        if (response := not_modified(request, etag)) is not None:
+            return response
+
+    with stage("compress"):
+        body, encoding = compress(body, request.headers.get("accept-encoding", ""))
+
+    headers = {**(headers or {}), "Vary": _VARY}
+    if etag is not None:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type=media_type, headers=headers)
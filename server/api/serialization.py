@@ -0,0 +1,77 @@
+import json
+from typing import Any, Dict, List
+
+import numpy as np
+import shapely
+from fastapi import Response
+from pandas import DataFrame, Series, isna
+from shapely.geometry.base import BaseGeometry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _loads(text: str) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _geojson(geometries: np.ndarray) -> List[Any]:
+    # to_geojson writes every geometry in one call; missing geometries come back as None.
+    return [None if text is None else _loads(text) for text in shapely.to_geojson(geometries).tolist()]
+
+
+def _column_values(column: Series) -> List[Any]:
+    if column.dtype == "geometry":
+        return _geojson(np.asarray(column.values))
+    # Converting the whole column at once turns numpy scalars into Python ones and NaN, None and NA into None.
+    return column.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def frame_records(frame: DataFrame) -> List[Dict[str, Any]]:
+    """JSON-ready dicts for every row of ``frame``, converted column by column."""
+    columns = [_column_values(frame[column]) for column in frame.columns]
+    return [dict(zip(frame.columns, row)) for row in zip(*columns)]
+
+
+def row_record(row: Series) -> Dict[str, Any]:
+    """JSON-ready dict for a single row, e.g. one taken out of a frame with ``iloc``."""
+    values = row.to_numpy(dtype=object, copy=True)
+    geometries = np.array([isinstance(value, BaseGeometry) for value in values], dtype=bool)
+    if geometries.any():
+        values[geometries] = _geojson(values[geometries])
+    return {key: None if not isinstance(value, (list, dict, np.ndarray)) and isna(value) else value
+            for key, value in zip(row.index, values)}
+
+
+def serialize_relationships(relationships: Dict[str, Any]) -> Dict[str, Any]:
+    result = {}
+    for key, value in relationships.items():
+        if isinstance(value, DataFrame):
+            result[key] = frame_records(value)
+        elif isinstance(value, Series):
+            result[key] = row_record(value)
+        elif isinstance(value, (np.floating, float)):
+            result[key] = None if np.isnan(value) else float(value)
+        else:
+            result[key] = value
+    return result
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default).encode()
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    return Response(content=dumps(content), status_code=status_code, media_type="application/json")
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "anthropic")
+LLM_MODEL = os.environ.get("LLM_MODEL", "claude-opus-4-6")
+FAKE_LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "0"))
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_TTL = float(os.environ.get("JOB_TTL", "3600"))
+
+CITY_CACHE_SIZE = int(os.environ.get("CITY_CACHE_SIZE", "8"))
+CITY_CACHE_TTL = float(os.environ.get("CITY_CACHE_TTL", str(6 * 60 * 60)))
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", "2048"))
+
+TRACE_MEMORY = os.environ.get("TRACE_MEMORY", "0") == "1"
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "gis-anomaly-profiles"))
+
+WARMUP = os.environ.get("WARMUP", "1") == "1"
+
+PREWARM_CITIES = [city.strip() for city in os.environ.get("PREWARM_CITIES", "").split(";") if city.strip()]
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", "3"))
+PREWARM_INTERVAL = float(os.environ.get("PREWARM_INTERVAL", str(30 * 60)))
+PREWARM_WINDOW = float(os.environ.get("PREWARM_WINDOW", str(24 * 60 * 60)))
+PREWARM_CONCURRENCY = int(os.environ.get("PREWARM_CONCURRENCY", "2"))
+
+# Set SHARED_CACHE_DIR to an empty string to keep built cities private to each worker process.
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gis-anomaly-cities"))
+SHARED_CACHE_BUILD_TIMEOUT = float(os.environ.get("SHARED_CACHE_BUILD_TIMEOUT", "900"))
+SHARED_CACHE_POLL = float(os.environ.get("SHARED_CACHE_POLL", "1"))
+
+ADMISSION_MAX_AREA_KM2 = float(os.environ.get("ADMISSION_MAX_AREA_KM2", "5000"))
+ADMISSION_MAX_FEATURES = int(os.environ.get("ADMISSION_MAX_FEATURES", "250000"))
+ADMISSION_BUDGET_KM2 = float(os.environ.get("ADMISSION_BUDGET_KM2", "5000"))
+ADMISSION_DEFAULT_AREA_KM2 = float(os.environ.get("ADMISSION_DEFAULT_AREA_KM2", "500"))
+ADMISSION_PER_CLIENT = int(os.environ.get("ADMISSION_PER_CLIENT", "1"))
+ADMISSION_RETRY_AFTER = float(os.environ.get("ADMISSION_RETRY_AFTER", "30"))
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Iterator, TYPE_CHECKING
+
+from server.api import settings
+from server.api.metrics import METRICS, stage
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from server.api.anomaly_detection import CityData
+
+_LOGGER = logging.getLogger(__name__)
+
+METRICS.describe("shared_cache_loads_total", "Cities loaded from the cross-worker shared cache.")
+METRICS.describe("shared_cache_saves_total", "Cities written to the cross-worker shared cache.")
+
+# Object columns holding lists or mixed types (osmid, highway, lanes on merged OSM ways) are stored as JSON strings.
+_JSON_COLUMNS_KEY = b"gis_anomaly.json_columns"
+_GRAPH_ATTRS_KEY = b"gis_anomaly.graph_attrs"
+_ASSESSMENT_KEY = b"gis_anomaly.assessment"
+
+_FRAMES = ("dataset", "edges", "amenities", "nodes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cities (
+    key TEXT PRIMARY KEY,
+    city TEXT NOT NULL,
+    version TEXT,
+    built REAL,
+    builder_pid INTEGER,
+    build_started REAL
+)
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _to_table(frame: 'GeoDataFrame', metadata: Optional[Dict[bytes, bytes]] = None):
+    import pyarrow
+
+    frame = frame.copy()
+    json_columns = []
+    for column in frame.columns:
+        if column == frame.geometry.name or frame[column].dtype != object:
+            continue
+        try:
+            pyarrow.array(frame[column])
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError):
+            frame[column] = [None if _is_missing(value) else json.dumps(value, default=str) for value in frame[column]]
+            json_columns.append(column)
+
+    table = pyarrow.table(frame.to_arrow(geometry_encoding="WKB", index=True))
+    metadata = {**(table.schema.metadata or {}), **(metadata or {}), _JSON_COLUMNS_KEY: json.dumps(json_columns).encode()}
+    return table.replace_schema_metadata(metadata)
+
+
+def _from_table(table) -> 'GeoDataFrame':
+    from geopandas import GeoDataFrame
+
+    # split_blocks keeps null-free numeric columns as views on the memory-mapped buffers instead of copies.
+    frame = GeoDataFrame.from_arrow(table, to_pandas_kwargs={"split_blocks": True})
+    for column in json.loads(table.schema.metadata.get(_JSON_COLUMNS_KEY, b"[]")):
+        frame[column] = [None if _is_missing(value) else json.loads(value) for value in frame[column]]
+    return frame
+
+
+def _write_table(path: str, table) -> None:
+    import pyarrow
+
+    with pyarrow.OSFile(path, "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path: str):
+    import pyarrow
+
+    # The mapping stays alive for as long as the table's buffers reference it.
+    return pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+
+
+def _assessment_path(directory: str, percent: float, nsmallest: int) -> str:
+    from server.api.anomaly_detection import pipeline_version
+
+    digest = hashlib.sha256(f"{pipeline_version()}|{percent}|{nsmallest}".encode()).hexdigest()[:16]
+    return os.path.join(directory, f"assessments-{digest}.arrow")
+
+
+def _write_assessments(directory: str, city_data: 'CityData') -> None:
+    from server.api.anomaly_detection import pipeline_version
+
+    for (percent, nsmallest), assessed in city_data.assessments.items():
+        path = _assessment_path(directory, percent, nsmallest)
+        if os.path.exists(path):
+            continue
+
+        description = {"pipeline": pipeline_version(), "percent": percent, "nsmallest": nsmallest}
+        staging = f"{path}.{os.getpid()}.tmp"
+        _write_table(staging, _to_table(assessed, {_ASSESSMENT_KEY: json.dumps(description).encode()}))
+        os.replace(staging, path)
+
+
+def _read_assessments(directory: str) -> Dict[Tuple[float, int], 'GeoDataFrame']:
+    """Assessments stored with a snapshot; ones from another detector, LLM or prompt version are ignored."""
+    from server.api.anomaly_detection import pipeline_version
+
+    assessments = {}
+    for entry in os.listdir(directory):
+        if not (entry.startswith("assessments-") and entry.endswith(".arrow")):
+            continue
+
+        table = _read_table(os.path.join(directory, entry))
+        description = json.loads(table.schema.metadata[_ASSESSMENT_KEY])
+        if description["pipeline"] == pipeline_version():
+            assessments[(description["percent"], description["nsmallest"])] = _from_table(table)
+    return assessments
+
+
+class SharedCityStore:
+    """Built cities shared by every worker on this host.
+
+    Each city snapshot is a directory of uncompressed Arrow IPC files that readers memory-map. The raw buffers live
+    once in the page cache, and null-free numeric columns stay views on them, but every process still decodes its
+    own geometry arrays from the WKB and builds its own spatial indexes. What a load saves is the download and
+    the build, not that per-process memory. A SQLite index records
+    the current snapshot of each city and which process is building it, so workers wait for a build in progress
+    instead of repeating it. Full-quality assessments are stored next to the frames, so workers that load a
+    snapshot serve the same anomalies without calling the LLM again.
+    """
+
+    def __init__(self, directory: str = settings.SHARED_CACHE_DIR, ttl: float = settings.CITY_CACHE_TTL,
+                 build_timeout: float = settings.SHARED_CACHE_BUILD_TIMEOUT) -> None:
+        self._directory = directory
+        self._ttl = ttl
+        self._build_timeout = build_timeout
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(os.path.join(self._directory, "index.sqlite"), timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def _snapshot_dir(self, key: str, version: str) -> str:
+        return os.path.join(self._directory, self._digest(key), version)
+
+    def _current(self, key: str, max_age: float) -> Optional[Tuple[str, float]]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT version, built FROM cities WHERE key = ?", (key,)).fetchone()
+
+        if row is None or row[0] is None or time.time() - row[1] > max_age:
+            return None
+        return row
+
+    def has(self, key: str) -> bool:
+        return self._current(key, self._ttl) is not None
+
+    def load(self, key: str, max_age: Optional[float] = None) -> Optional['CityData']:
+        from server.api.anomaly_detection import CityData
+
+        current = self._current(key, self._ttl if max_age is None else max_age)
+        if current is None:
+            return None
+
+        directory = self._snapshot_dir(key, current[0])
+        tables = {}
+        with stage("shared_cache_load"):
+            try:
+                for name in _FRAMES:
+                    tables[name] = _read_table(os.path.join(directory, f"{name}.arrow"))
+                assessments = _read_assessments(directory)
+            except FileNotFoundError:
+                # Superseded and removed between reading the index and opening the files.
+                return None
+
+            frames = {name: _from_table(table) for name, table in tables.items()}
+            graph_attrs = json.loads(tables["nodes"].schema.metadata[_GRAPH_ATTRS_KEY])
+            city_data = CityData.from_frames(frames["dataset"], frames["edges"], frames["amenities"], frames["nodes"],
+                                             graph_attrs, snapshot=current[0], assessments=assessments)
+
+        METRICS.increment("shared_cache_loads_total")
+        return city_data
+
+    def claim(self, key: str, city: str) -> bool:
+        """Mark this process as the builder of ``key``; False while another live process is building it."""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT builder_pid, build_started FROM cities WHERE key = ?",
+                                         (key,)).fetchone()
+                if row is not None and row[0] is not None and row[0] != os.getpid() and _pid_alive(row[0]) \
+                        and now - row[1] < self._build_timeout:
+                    return False
+
+                connection.execute(
+                    "INSERT INTO cities (key, city, builder_pid, build_started) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET builder_pid = excluded.builder_pid, "
+                    "build_started = excluded.build_started",
+                    (key, city, os.getpid(), now))
+                return True
+            finally:
+                connection.execute("COMMIT")
+
+    def release(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE cities SET builder_pid = NULL WHERE key = ? AND builder_pid = ?",
+                               (key, os.getpid()))
+
+    def save(self, key: str, city: str, city_data: 'CityData') -> None:
+        from osmnx import graph_to_gdfs
+
+        # Snapshot ids double as directory names, so every worker sees the same id (and ETag) for one build.
+        version = city_data.snapshot
+        directory = self._snapshot_dir(key, version)
+        staging = f"{directory}.tmp"
+
+        with stage("shared_cache_save"):
+            nodes = graph_to_gdfs(city_data.street_graph, edges=False)
+            frames = {
+                "dataset": _to_table(city_data.dataset),
+                "edges": _to_table(city_data.street_edges),
+                "amenities": _to_table(city_data.amenities),
+                "nodes": _to_table(nodes, {_GRAPH_ATTRS_KEY: json.dumps(city_data.street_graph.graph,
+                                                                        default=str).encode()}),
+            }
+            os.makedirs(staging)
+            try:
+                for name, table in frames.items():
+                    _write_table(os.path.join(staging, f"{name}.arrow"), table)
+                _write_assessments(staging, city_data)
+                os.rename(staging, directory)
+            except BaseException:
+                # A half-written snapshot (e.g. a full disk) is never indexed, so it is only wasted space.
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO cities (key, city, version, built) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET city = excluded.city, version = excluded.version, built = excluded.built",
+                (key, city, version, time.time()))
+
+        # Workers still holding an older snapshot keep their mappings valid after the files are unlinked.
+        parent = os.path.dirname(directory)
+        for entry in os.listdir(parent):
+            if entry != version:
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+        METRICS.increment("shared_cache_saves_total")
+
+    def save_assessments(self, key: str, city_data: 'CityData') -> None:
+        """Add assessments computed since ``save`` to the city's snapshot; already stored ones are left alone."""
+        directory = self._snapshot_dir(key, city_data.snapshot)
+        if not os.path.isdir(directory):
+            # Built without the store, or superseded by a newer snapshot.
+            return
+
+        try:
+            _write_assessments(directory, city_data)
+        except FileNotFoundError:
+            # The snapshot was superseded and removed while writing.
+            pass
+
+
+def get_shared_store() -> Optional[SharedCityStore]:
+    if not settings.SHARED_CACHE_DIR:
+        return None
+
+    try:
+        return SharedCityStore(settings.SHARED_CACHE_DIR)
+    except (OSError, sqlite3.Error) as e:
+        # Cities are then kept private to this process, as with SHARED_CACHE_DIR empty, instead of failing startup.
+        _LOGGER.warning("Shared city store at %s is unavailable: %s", settings.SHARED_CACHE_DIR, e)
+        return None
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Any, Callable, Dict, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from server.api.metrics import METRICS
+
+METRICS.describe("singleflight_computations_total", "Computations started on behalf of one or more requests.")
+METRICS.describe("singleflight_coalesced_requests_total", "Requests that waited on an identical in-flight computation.")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one threadpool computation and shares its result."""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+            METRICS.increment("singleflight_computations_total", endpoint=self._name)
+        else:
+            METRICS.increment("singleflight_coalesced_requests_total", endpoint=self._name)
+
+        # Shielded so a disconnecting caller does not cancel the computation other callers are waiting on.
+        return await asyncio.shield(task)
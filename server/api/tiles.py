@@ -0,0 +1,122 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from weakref import WeakKeyDictionary
+
+import shapely
+from geopandas import GeoDataFrame
+from shapely import box
+
+from server.api import settings
+from server.api.anomaly_detection import CityData
+from server.api.constants import ANOMALY_HEADERS
+from server.api.metrics import METRICS
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+TILE_EXTENT = 4096
+TILE_LAYERS: Dict[str, List[str]] = {
+    "amenities": ["name", "amenity", ANOMALY_HEADERS[1], ANOMALY_HEADERS[2]],
+    "edges": ["name", "highway"],
+    "buildings": ["name", "building"],
+}
+
+_WEB_MERCATOR_HALF = 20037508.342789244
+_BUFFER_PIXELS = 64
+
+METRICS.describe("tile_cache_hits_total", "Vector tiles served from the tile cache.")
+METRICS.describe("tile_cache_misses_total", "Vector tiles rendered on request.")
+
+_Bounds = Tuple[float, float, float, float]
+
+
+def tile_bounds(z: int, x: int, y: int) -> _Bounds:
+    size = 2 * _WEB_MERCATOR_HALF / 2 ** z
+    min_x = -_WEB_MERCATOR_HALF + x * size
+    max_y = _WEB_MERCATOR_HALF - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def _properties(row: Dict) -> Dict:
+    # MVT has no null value and only scalar types, so missing values are dropped and anything else stringified.
+    properties = {}
+    for key, value in row.items():
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        properties[key] = value if isinstance(value, (str, int, float, bool)) else str(value)
+    return properties
+
+
+def render_tile(frame: GeoDataFrame, layer: str, bounds: _Bounds) -> bytes:
+    """Encode the features of a Web Mercator frame that fall in one tile, clipped and simplified to tile resolution."""
+    import mapbox_vector_tile
+
+    min_x, min_y, max_x, max_y = bounds
+    pixel = (max_x - min_x) / TILE_EXTENT
+    buffered = (min_x - _BUFFER_PIXELS * pixel, min_y - _BUFFER_PIXELS * pixel,
+                max_x + _BUFFER_PIXELS * pixel, max_y + _BUFFER_PIXELS * pixel)
+
+    subset = frame.iloc[frame.sindex.query(box(*buffered), predicate="intersects")]
+    geometries = shapely.simplify(shapely.clip_by_rect(subset.geometry.values, *buffered), pixel,
+                                  preserve_topology=True)
+
+    columns = [column for column in TILE_LAYERS[layer] if column in subset.columns]
+    features = [
+        {"geometry": geometry, "properties": _properties(row)}
+        for geometry, row in zip(geometries, subset[columns].to_dict("records"))
+        if not geometry.is_empty
+    ]
+
+    return mapbox_vector_tile.encode([{"name": layer, "features": features}],
+                                     default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT})
+
+
+class _CityTiles:
+    def __init__(self) -> None:
+        self.mercator: Dict[str, GeoDataFrame] = {}
+        self.tiles: OrderedDict[Tuple[str, int, int, int], bytes] = OrderedDict()
+
+
+class TileCache:
+    """Rendered tiles per CityData; entries disappear with the city when it leaves the city cache."""
+
+    def __init__(self, max_tiles: int = settings.TILE_CACHE_SIZE) -> None:
+        self._max_tiles = max_tiles
+        self._lock = threading.Lock()
+        self._cities: WeakKeyDictionary[CityData, _CityTiles] = WeakKeyDictionary()
+
+    @staticmethod
+    def _layer_frame(city_data: CityData, layer: str) -> GeoDataFrame:
+        if layer == "amenities":
+            return city_data.scored_amenities
+        return city_data.get_layer(layer)
+
+    def get(self, city_data: CityData, layer: str, z: int, x: int, y: int) -> bytes:
+        key = (layer, z, x, y)
+
+        with self._lock:
+            city_tiles = self._cities.setdefault(city_data, _CityTiles())
+            tile = city_tiles.tiles.get(key)
+            if tile is not None:
+                city_tiles.tiles.move_to_end(key)
+                METRICS.increment("tile_cache_hits_total")
+                return tile
+
+            frame = city_tiles.mercator.get(layer)
+
+        METRICS.increment("tile_cache_misses_total")
+        if frame is None:
+            frame = self._layer_frame(city_data, layer).to_crs(epsg=3857)
+
+        tile = render_tile(frame, layer, tile_bounds(z, x, y))
+
+        with self._lock:
+            city_tiles.mercator[layer] = frame
+            city_tiles.tiles[key] = tile
+            while len(city_tiles.tiles) > self._max_tiles:
+                city_tiles.tiles.popitem(last=False)
+
+        return tile
+
+
+TILE_CACHE = TileCache()
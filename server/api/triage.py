@@ -0,0 +1,66 @@
+from typing import Tuple
+
+import numpy as np
+from geopandas import GeoDataFrame
+from pandas import DataFrame, Series
+
+from server.api.constants import DATA_HEADERS, ASSESSMENT_HEADERS, ANOMALY_HEADERS
+
+RULE_SOURCE = "rule"
+LLM_SOURCE = "llm"
+MODEL_SOURCE = "model"
+
+_ON_STREET_METERS = 1.0
+_DENSE_NEIGHBOURS = 10
+_REMOTE_STREET_METERS = 1000.0
+_STACKED_BUILDINGS = 2
+
+
+def triage_anomalies(anomalies: GeoDataFrame) -> Tuple[GeoDataFrame, GeoDataFrame]:
+    """Split anomalies into rows with a deterministic rule-based assessment and ambiguous rows for the LLM."""
+    street = anomalies[DATA_HEADERS[1]].fillna(0).to_numpy(dtype=float)
+    density = anomalies[DATA_HEADERS[3]].fillna(0).to_numpy(dtype=int)
+    intersections = anomalies[DATA_HEADERS[4]].fillna(0).to_numpy(dtype=int)
+
+    conditions = [
+        intersections >= _STACKED_BUILDINGS,
+        (street > _REMOTE_STREET_METERS) & (density == 0),
+        (street <= _ON_STREET_METERS) & (density >= _DENSE_NEIGHBOURS),
+    ]
+    risk_levels = ["high", "high", "low"]
+    explanations = [
+        "Point lies inside " + Series(intersections).astype(str) + " overlapping building footprints.",
+        "Located " + Series(street.round()).astype(int).astype(str) + " m from any road with no amenities nearby.",
+        "On a street with " + Series(density).astype(str) + " amenities within 500 m; typical urban placement.",
+    ]
+    suggested_checks = [
+        "Check for duplicate or overlapping building polygons.",
+        "Verify coordinates against satellite imagery.",
+        "No action needed beyond routine tag review.",
+    ]
+
+    decided = np.any(conditions, axis=0)
+    assessments = DataFrame({
+        ASSESSMENT_HEADERS[0]: np.select(conditions, risk_levels, default=""),
+        ASSESSMENT_HEADERS[1]: np.select(conditions, [e.to_numpy() for e in explanations], default=""),
+        ASSESSMENT_HEADERS[2]: np.select(conditions, suggested_checks, default=""),
+        ASSESSMENT_HEADERS[3]: RULE_SOURCE,
+    }, index=anomalies.index)
+
+    return anomalies[decided].join(assessments[decided]), anomalies[~decided]
+
+
+_SKIPPED_LLM_EXPLANATION = "Scored by IsolationForest only; the LLM assessment was skipped to meet the deadline."
+PENDING_LLM_EXPLANATION = "Provisional IsolationForest assessment; the LLM assessment is still running."
+
+
+def model_only_assessments(anomalies: GeoDataFrame, explanation: str = _SKIPPED_LLM_EXPLANATION) -> GeoDataFrame:
+    """Assess rows from the IsolationForest result alone, for when there is no time (yet) for the LLM."""
+    flagged = anomalies[ANOMALY_HEADERS[2]].fillna(0).to_numpy(dtype=int) == 1
+
+    return anomalies.join(DataFrame({
+        ASSESSMENT_HEADERS[0]: np.where(flagged, "medium", "low"),
+        ASSESSMENT_HEADERS[1]: explanation,
+        ASSESSMENT_HEADERS[2]: "Review the tags and location manually.",
+        ASSESSMENT_HEADERS[3]: MODEL_SOURCE,
+    }, index=anomalies.index))
@@ -1,41 +1,23 @@
-import math
-from typing import Dict
-
 import numpy as np
-from geopandas import GeoDataFrame
-from pandas import Series
-from shapely import Point, Polygon
-
-
-def is_geometrical_entry(location: Series) -> bool:
-    try:
-        return hasattr(location['geometry'], 'x') and hasattr(location['geometry'], 'y')
-    except (AttributeError, KeyError):
-        return False
-
+import shapely
+from shapely.geometry.base import BaseGeometry
 
-def to_meters(map_data: GeoDataFrame) -> GeoDataFrame:
-    return map_data.to_crs(map_data.estimate_utm_crs())
+_POINT = 0
 
 
-def get_center_of_polygon(location: Series) -> Point:
-    p = location['geometry']
-    assert isinstance(p, Polygon)
+def representative_point(geometry: BaseGeometry) -> BaseGeometry:
+    """A point guaranteed to lie on the geometry, for any geometry type; points are returned unchanged."""
+    return geometry if shapely.get_type_id(geometry) == _POINT else shapely.point_on_surface(geometry)
 
-    return p.centroid
 
+def representative_points(geometries: np.ndarray) -> np.ndarray:
+    """``representative_point`` for a whole layer in one vectorized pass.
 
-def serialize_location(location: Series) -> Dict:
-    result = {}
-    for key, value in location.items():
-        if isinstance(value, np.integer):
-            result[key] = int(value)
-        elif isinstance(value, (np.floating, float)):
-            result[key] = None if math.isnan(value) else float(value)
-        elif isinstance(value, np.bool_):
-            result[key] = bool(value)
-        elif hasattr(value, '__geo_interface__'):  # Shapely geometry
-            result[key] = value.__geo_interface__
-        else:
-            result[key] = value
-    return result
+    Unlike centroids, these lie inside polygons and on lines, so point-in-building tests and nearest-street lookups
+    treat every geometry type alike.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    points = geometries.copy()
+    shapes = shapely.get_type_id(geometries) != _POINT
+    points[shapes] = shapely.point_on_surface(geometries[shapes])
+    return points
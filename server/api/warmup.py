@@ -0,0 +1,48 @@
+import importlib
+import logging
+import threading
+import time
+
+from server.api.metrics import METRICS
+
+_HEAVY_MODULES = [
+    "server.api.anomaly_detection",
+    "server.api.layers",
+    "server.api.tiles",
+    "server.api.utilities",
+    "shapely",
+    "pyarrow",
+]
+
+_LOGGER = logging.getLogger(__name__)
+_WARM = threading.Event()
+
+METRICS.describe("warmup_seconds", "Time the background warm-up took to import heavy modules and build clients.")
+
+
+def is_warm() -> bool:
+    return _WARM.is_set()
+
+
+def warm_up() -> None:
+    start = time.perf_counter()
+    for name in _HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            _LOGGER.warning("Warm-up could not import %s: %s", name, e)
+
+    from server.api.anomaly_detection import get_claude_client
+    try:
+        get_claude_client()
+    except Exception as e:
+        _LOGGER.warning("Warm-up could not build the LLM client: %s", e)
+
+    METRICS.set_gauge("warmup_seconds", time.perf_counter() - start)
+    _WARM.set()
+
+
+def start_background_warm_up() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -1,9 +1,51 @@
-from fastapi import FastAPI
-from server.api.anomaly_detection import CityData, get_location_data
-from server.api.utilities import serialize_location
+import math
+import os
+import tracemalloc
+from contextlib import asynccontextmanager
+from typing import Optional, List, Tuple, TYPE_CHECKING
+
+from fastapi import FastAPI, HTTPException, Response, Request, Query, Path
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from server.api import settings
+from server.api.admission import ADMISSION, client_for
+from server.api.city_cache import CITY_CACHE, normalize_city
+from server.api.constants import EXPORT_LAYERS
+from server.api.deadline import Deadline, STAGE_COSTS
+from server.api.jobs import JobQueue
+from server.api.metrics import METRICS, PROMETHEUS_CONTENT_TYPE, stage, track_request
+from server.api.prewarm import PREWARM, POPULARITY
+from server.api.profiling import profiled, request_profiling, profile_requested, request_id_for, is_admin, \
+    artifact_path
+from server.api.responses import frame_response, encode_frame, entity_tag, not_modified, FLATGEOBUF
+from server.api.singleflight import SingleFlight
+from server.api.warmup import start_background_warm_up, is_warm
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+# Geospatial, ML and LLM dependencies are imported inside the routes that need them (or by the background
+# warm-up), so importing this module stays cheap and health checks answer immediately on cold start.
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+_JOBS = JobQueue(admission=ADMISSION)
+_ANOMALY_FLIGHT = SingleFlight("anomaly")
+_OSMNX_FLIGHT = SingleFlight("osmnx")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if settings.TRACE_MEMORY:
+        tracemalloc.start()
+    if settings.WARMUP:
+        start_background_warm_up()
+    PREWARM.start()
+    yield
+    PREWARM.stop()
+    _JOBS.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -12,63 +54,273 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by the frontend: layer paging, conditional requests and deadline degradations.
+    expose_headers=["X-Next-Cursor", "ETag", "X-Degradations", "Retry-After"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    with track_request() as timings:
+        response = await call_next(request)
+
+    if timings.stages:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request_id_for(request)
+    profiling = profile_requested(request)
+
+    with request_profiling(request_id if profiling else None) as profile:
+        response = await call_next(request)
+
+    response.headers["X-Request-ID"] = request_id
+    if profile is not None and profile.written:
+        response.headers["X-Profile-Id"] = request_id
+    return response
+
+
 @app.get("/")
 def root():
     return {"status": "API running"}
 
 
+@app.get("/ready")
+def ready():
+    return {"warm": is_warm()}
+
+
+@app.get("/version")
+def version():
+    from server.api.anomaly_detection import pipeline_version
+
+    return {"pipeline": pipeline_version()}
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=METRICS.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/profiles/{request_id}")
+def get_profile(request: Request, request_id: str, raw: bool = False):
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+    path = artifact_path(request_id, "prof" if raw else "txt")
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return FileResponse(path, media_type="application/octet-stream" if raw else "text/plain")
+
+
+@profiled
+def _anomaly_frame(city: str, deadline: Optional[Deadline] = None) -> Tuple['GeoDataFrame', List[str], str]:
+    city_data = CITY_CACHE.get(city)
+    anomalies = city_data.ai_anomaly_response(deadline=deadline)
+    degradations = deadline.degradations if deadline is not None else []
+    if not degradations:
+        CITY_CACHE.share_assessments(city, city_data)
+
+    with stage("wgs84_projection", rows=len(anomalies)):
+        return anomalies.to_crs(epsg=4326), degradations, city_data.assessment_version()
+
+
 @app.get("/anomaly")
-def anomaly(city: str):
-    city_data = CityData.from_location(city)
+async def anomaly(request: Request, city: str, format: Optional[str] = None,
+                  precision: Optional[int] = Query(None, ge=0, le=15),
+                  deadline: Optional[float] = Query(None, gt=0, le=600)):
+    # A client revalidating a warm city is answered from the snapshot's version without running the pipeline.
+    city_data = CITY_CACHE.peek(city)
+    if city_data is not None and deadline is None:
+        cached = not_modified(request, entity_tag(request, city_data.assessment_version(), format, precision))
+        if cached is not None:
+            POPULARITY.record(city)
+            return cached
 
-    return city_data.ai_anomaly_response().to_crs(epsg=4326).to_json()
+    budget = Deadline(deadline) if deadline is not None else None
+    if budget is not None and not CITY_CACHE.is_warm(city):
+        build_seconds = STAGE_COSTS.estimate("city_build")
+        if budget.remaining() < build_seconds:
+            # The build cannot be cut short, so rather than overrun the deadline the city is built for a retry.
+            await run_in_threadpool(ADMISSION.build_in_background, city, client_for(request))
+            METRICS.increment("deadline_cold_builds_total")
+            raise HTTPException(status_code=503, detail=f"'{city}' is not built yet and takes longer than the "
+                                f"deadline to build; it is being built now",
+                                headers={"Retry-After": str(max(1, math.ceil(build_seconds)))})
+
+    ticket = await run_in_threadpool(ADMISSION.acquire, city, client_for(request))
+    try:
+        # Only identical deadlines are coalesced, since followers get the leader's frame and degradations.
+        frame, degradations, version = await _ANOMALY_FLIGHT.do((normalize_city(city), deadline), _anomaly_frame,
+                                                                city, budget)
+    finally:
+        ADMISSION.release(ticket)
+    # Only answered requests count, so cities that admission turns away never become pre-warming targets.
+    POPULARITY.record(city)
+
+    if budget is None:
+        return await run_in_threadpool(frame_response, frame, request, format=format, precision=precision,
+                                       version=version)
+
+    # Deadline responses describe their degradations, so they are not interchangeable with cached full answers.
+    return await run_in_threadpool(frame_response, frame, request, format=format, precision=precision,
+                                   headers={"X-Degradations": ",".join(degradations) or "none"},
+                                   members={"degradations": degradations}, cacheable=False)
+
+class JobRequest(BaseModel):
+    city: str
+    percent: float = 0.05
+    nsmallest: int = 5
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(http_request: Request, request: JobRequest):
+    job = _JOBS.submit(request.city, percent=request.percent, nsmallest=request.nsmallest,
+                       client=client_for(http_request))
+    POPULARITY.record(request.city)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = _JOBS.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+@profiled
+def _osmnx_frame(city: str) -> 'GeoDataFrame':
+    from server.api.anomaly_detection import get_location_data
 
-@app.get("/osmnx")
-def osmnx(city: str):
     dataset, _ = get_location_data(city)
-    return dataset.to_json()
-
-@app.get("/debug")
-def debug(city: str):
-    city_data = CityData.from_location(city)
-    return {
-        "dataset": city_data.dataset.to_json(),
-        "street_lines": city_data.street_graph,
-        "street_edges": city_data.street_edges,
-        "buildings": city_data.buildings,
-        "amenities": city_data.amenities,
-    }
+    return dataset
+
+
+@app.get("/osmnx")
+async def osmnx(request: Request, city: str, format: Optional[str] = None,
+                precision: Optional[int] = Query(None, ge=0, le=15)):
+    ticket = await run_in_threadpool(ADMISSION.acquire, city, client_for(request))
+    try:
+        frame = await _OSMNX_FLIGHT.do(normalize_city(city), _osmnx_frame, city)
+    finally:
+        ADMISSION.release(ticket)
+
+    return await run_in_threadpool(frame_response, frame, request, format=format, precision=precision)
+
+@app.get("/layers/{layer}")
+@profiled
+def export_layer(request: Request, layer: str, city: str, bbox: Optional[str] = None, columns: Optional[str] = None,
+                 cursor: Optional[int] = Query(None, ge=0), limit: int = Query(1000, ge=1, le=50000),
+                 format: str = Query("ndjson", pattern="^(ndjson|fgb)$")):
+    if layer not in EXPORT_LAYERS:
+        raise HTTPException(status_code=404, detail=f"Unknown layer '{layer}', expected one of {EXPORT_LAYERS}")
+
+    from server.api.layers import parse_bbox, parse_columns, select_positions, paginate, page_frame, iter_ndjson
+
+    with ADMISSION.admit(city, client_for(request)):
+        frame = CITY_CACHE.get(city).get_layer(layer)
+    selected = parse_columns(frame, columns)
+    positions, next_cursor = paginate(select_positions(frame, parse_bbox(bbox)), cursor, limit)
+
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+
+    if format == "fgb":
+        return Response(content=encode_frame(page_frame(frame, positions, selected), FLATGEOBUF),
+                        media_type=FLATGEOBUF, headers=headers)
+
+    return StreamingResponse(iter_ndjson(frame, positions, selected), media_type="application/x-ndjson",
+                             headers=headers)
+
+@app.get("/tiles/{city}/{layer}/{z}/{x}/{y}.mvt")
+@profiled
+def vector_tile(request: Request, city: str, layer: str, x: int, y: int, z: int = Path(ge=0, le=22)):
+    from server.api.tiles import TILE_CACHE, TILE_LAYERS, MVT_CONTENT_TYPE
+
+    if layer not in TILE_LAYERS:
+        raise HTTPException(status_code=404, detail=f"Unknown tile layer '{layer}', expected one of {list(TILE_LAYERS)}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile outside the zoom level's range")
+
+    with ADMISSION.admit(city, client_for(request)):
+        city_data = CITY_CACHE.get(city)
+    tile = TILE_CACHE.get(city_data, layer, z, x, y)
+
+    return Response(content=tile, media_type=MVT_CONTENT_TYPE, headers={"Cache-Control": "public, max-age=3600"})
+
 
 @app.get("/place")
-def place(city: str, location: str):
-    city_data = CityData.from_location(city)
-    location_data = city_data.get_place_of_interest(location)
+@profiled
+def place(request: Request, city: str, location: str):
+    from server.api.serialization import frame_records, json_response
+
+    with ADMISSION.admit(city, client_for(request)):
+        city_data = CITY_CACHE.get(city)
+    positions = city_data.positions_named(location)
 
-    if len(location_data) == 0:
+    if len(positions) == 0:
         return {
             "error": "Location not found"
         }
 
-    return [data.to_json() for data in location_data]
+    return json_response(frame_records(city_data.amenities.iloc[positions]))
 
 
 @app.get("/nearest")
-def nearest(city: str, location: str, loc_id: int = 1):
+@profiled
+def nearest(request: Request, city: str, location: str, loc_id: int = 1):
+    from server.api.serialization import serialize_relationships, json_response
+
     index = loc_id - 1
-    city_data = CityData.from_location(city)
-    location_data = city_data.get_place_of_interest(location)
+    with ADMISSION.admit(city, client_for(request)):
+        city_data = CITY_CACHE.get(city)
+    positions = city_data.positions_named(location)
 
-    if len(location_data) == 0:
+    if not 0 <= index < len(positions):
         return {
             "error": "Location not found"
         }
 
-    return {
-        "place": serialize_location(location_data[0]),
-        "street": serialize_location(city_data.get_nearest_street(location_data[index])),
-        "location": serialize_location(city_data.get_nearest_location(location_data[index])[0]),
-        "nearby": [serialize_location(s) for s in city_data.get_nearby_locations(location_data[index], meters=500)],
-        "intersections": [serialize_location(s) for s in city_data.intersects_other_locations(location_data[index])]
-    }
\ No newline at end of file
+    relationships = city_data.nearest_batch([{"position": int(positions[index])}], meters=500)[0]
+    if "error" in relationships:
+        return relationships
+
+    return json_response(serialize_relationships({
+        "place": city_data.amenities.iloc[positions[0]],
+        "street": relationships["street"],
+        "location": relationships["location"],
+        "nearby": relationships["nearby"],
+        "intersections": relationships["intersections"],
+    }))
+
+
+class PlaceQuery(BaseModel):
+    name: Optional[str] = None
+    osm_id: Optional[int] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+
+
+class NearestBatchRequest(BaseModel):
+    city: str
+    places: List[PlaceQuery] = Field(max_length=1000)
+    # Bounded so one request cannot ask every place for every amenity in a large city.
+    meters: float = Field(500, gt=0, le=5000)
+
+
+@app.post("/nearest/batch")
+@profiled
+def nearest_batch(http_request: Request, request: NearestBatchRequest):
+    from server.api.serialization import serialize_relationships, json_response
+
+    with ADMISSION.admit(request.city, client_for(http_request)):
+        city_data = CITY_CACHE.get(request.city)
+    results = city_data.nearest_batch([place.model_dump() for place in request.places], meters=request.meters)
+
+    return json_response([serialize_relationships(result) for result in results])
@@ -0,0 +1,67 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy as np
+import pytest
+from geopandas import GeoDataFrame
+from shapely import Point, box
+
+# Offline tests must never reach a real LLM; this runs before any server module reads its settings.
+os.environ.setdefault("LLM_BACKEND", "fake")
+# Nor may they share city snapshots with earlier runs, or a city built by one run is already warm in the next.
+os.environ["SHARED_CACHE_DIR"] = tempfile.mkdtemp(prefix="gis-anomaly-test-cities-")
+atexit.register(shutil.rmtree, os.environ["SHARED_CACHE_DIR"], ignore_errors=True)
+
+SYNTHETIC_CITY = "Synthetic City"
+ORIGIN = (-95.99, 36.15)
+
+
+def synthetic_features_and_graph():
+    """A few dozen named points and footprints on a 4x4 two-way street grid, about 1 km across, in WGS84."""
+    rng = np.random.default_rng(0)
+    lon, lat = ORIGIN
+    step = 0.003
+
+    xs, ys = lon + rng.random(40) * step * 3, lat + rng.random(40) * step * 3
+    geometries = [Point(x, y) for x, y in zip(xs[:30], ys[:30])] + \
+        [box(x, y, x + 0.0002, y + 0.0002) for x, y in zip(xs[30:], ys[30:])]
+    features = GeoDataFrame({
+        "name": [f"Place {i}" for i in range(40)] + [None] * 5,
+        "amenity": ["cafe"] * 40 + [None] * 5,
+        "building": [None] * 30 + ["yes"] * 15,
+    }, geometry=geometries + [box(x - 0.0004, y - 0.0004, x + 0.0004, y + 0.0004) for x, y in zip(xs[:5], ys[:5])],
+        crs="EPSG:4326")
+
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    for row in range(4):
+        for column in range(4):
+            graph.add_node(row * 4 + column, x=lon + column * step, y=lat + row * step)
+    for row in range(4):
+        for column in range(4):
+            node = row * 4 + column
+            for neighbour in ([node + 1] if column < 3 else []) + ([node + 4] if row < 3 else []):
+                for u, v in ((node, neighbour), (neighbour, node)):
+                    graph.add_edge(u, v, key=0, osmid=u * 100 + v, length=float(step * 111_000),
+                                   name=f"Street {min(u, v)}-{max(u, v)}", highway="residential")
+    return features, graph
+
+
+@pytest.fixture(scope="session")
+def synthetic_city():
+    from server.api.anomaly_detection import CityData
+
+    return CityData(*synthetic_features_and_graph())
+
+
+@pytest.fixture
+def client(synthetic_city):
+    """A TestClient whose city cache already holds ``SYNTHETIC_CITY``, so no request downloads anything."""
+    from fastapi.testclient import TestClient
+    from server.api.city_cache import CITY_CACHE
+    from server.main import app
+
+    CITY_CACHE.put(SYNTHETIC_CITY, synthetic_city)
+    return TestClient(app)
@@ -0,0 +1,88 @@
+import osmnx
+import pytest
+from fastapi import HTTPException
+from geopandas import GeoDataFrame
+from shapely import box
+
+from server.api import admission
+from server.api.admission import AdmissionController, boundary_area_km2
+
+
+class _FakeCache:
+    def __init__(self, warm=()) -> None:
+        self.warm = set(warm)
+
+    def is_warm(self, city: str) -> bool:
+        return city in self.warm
+
+    def peek(self, city: str):
+        return None
+
+
+@pytest.fixture(autouse=True)
+def _areas(monkeypatch) -> None:
+    areas = {"tulsa": 500.0, "austin": 800.0, "united states": 9.8e6}
+    monkeypatch.setattr(admission, "boundary_area_km2", lambda key: areas.get(key))
+
+
+def _controller(**kwargs) -> AdmissionController:
+    options = dict(max_area=5000, max_features=1000, budget=1000, default_area=300, per_client=1, retry_after=12)
+    options.update(kwargs)
+    return AdmissionController(_FakeCache(warm={"Boise"}), **options)
+
+
+def test_warm_cities_are_admitted_without_a_ticket() -> None:
+    assert _controller().acquire("Boise", "client") is None
+
+
+def test_oversized_area_is_rejected_up_front() -> None:
+    with pytest.raises(HTTPException) as rejected:
+        _controller().acquire("United States", "client")
+
+    assert rejected.value.status_code == 422
+
+
+def test_second_cold_city_from_one_client_gets_429_with_retry_after() -> None:
+    controller = _controller()
+    controller.acquire("Tulsa", "client")
+
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire("Austin", "client")
+
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers["Retry-After"] == "12"
+
+
+def test_budget_overflow_gets_503_but_identical_requests_join() -> None:
+    controller = _controller()
+    leader = controller.acquire("Tulsa", "a")
+
+    joined = controller.acquire("tulsa ", "b")
+    assert joined is not None and not joined.leader
+
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire("Austin", "c")
+    assert rejected.value.status_code == 503
+
+    controller.release(joined)
+    controller.release(leader)
+    assert controller.acquire("Austin", "c").leader
+
+
+def test_failed_geocodes_are_retried_and_successes_cached(monkeypatch) -> None:
+    calls = []
+
+    def geocode(city: str) -> GeoDataFrame:
+        calls.append(city)
+        if len(calls) == 1:
+            raise ConnectionError("Nominatim is unavailable")
+        return GeoDataFrame(geometry=[box(-96.0, 36.0, -95.99, 36.01)], crs="EPSG:4326")
+
+    monkeypatch.setattr(osmnx, "geocode_to_gdf", geocode)
+    admission._geocoded_area_km2.cache_clear()
+
+    assert boundary_area_km2("flaky city") is None
+    area = boundary_area_km2("flaky city")
+    assert area is not None and 0.5 < area < 2
+    assert boundary_area_km2("flaky city") == area
+    assert len(calls) == 2
@@ -0,0 +1,25 @@
+import json
+import subprocess
+import sys
+
+_STAGES = {"projection_features", "projection_graph", "graph_to_gdfs", "geometry_normalization",
+           "feature_engineering", "isolation_forest", "triage", "llm", "nearest_batch", "shared_cache_save",
+           "shared_cache_load"}
+
+
+def test_benchmark_reports_every_stage_per_size(tmp_path) -> None:
+    report = tmp_path / "report.json"
+    baseline = tmp_path / "baseline.json"
+    command = [sys.executable, "benchmarks/city_scaling.py", "--sizes", "200", "400", "--max-exponent", "10"]
+    subprocess.run(command + ["--report", str(baseline)], check=True, capture_output=True)
+    subprocess.run(command + ["--report", str(report), "--baseline", str(baseline), "--tolerance", "100"],
+                   check=True, capture_output=True)
+
+    result = json.loads(report.read_text())
+    assert [size["amenities"] for size in result["sizes"]] == [200, 400]
+    for size in result["sizes"]:
+        assert set(size["stages"]) == _STAGES
+        assert size["stages"]["feature_engineering"]["rows"] == size["amenities"]
+        assert size["stages"]["feature_engineering"]["peak_memory_bytes"] > 0
+        assert size["stages"]["feature_engineering"]["threshold_seconds"] > 0
+    assert result["regressions"] == []
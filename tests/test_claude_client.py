@@ -0,0 +1,37 @@
+import json
+
+from geopandas import GeoDataFrame
+from shapely import Point
+
+from server.api.claude_client import ClaudeClient
+from server.api.constants import DATA_HEADERS
+from server.api.llm_backend import FakeBackend
+
+_ASSESSMENT_KEYS = {"risk_level", "explanation", "suggested_check"}
+
+
+def _anomalies() -> GeoDataFrame:
+    return GeoDataFrame({
+        DATA_HEADERS[0]: ["Far Cafe", "Stacked Shop", "Corner Store"],
+        DATA_HEADERS[1]: [800.0, 0.0, 12.0],
+        DATA_HEADERS[2]: [900.0, 5.0, 40.0],
+        DATA_HEADERS[3]: [0, 14, 3],
+        DATA_HEADERS[4]: [0, 3, 0],
+    }, geometry=[Point(0, 0), Point(1, 1), Point(2, 2)], index=[7, 3, 9])
+
+
+def test_fake_backend_returns_schema_valid_assessments() -> None:
+    anomaly_data = ClaudeClient.parse_anomaly_data(_anomalies())
+    assessments = json.loads(FakeBackend().complete("", anomaly_data))
+
+    assert len(assessments) == 3
+    assert all(set(a) == _ASSESSMENT_KEYS for a in assessments)
+    assert [a["risk_level"] for a in assessments] == ["high", "medium", "low"]
+
+
+def test_build_response_joins_assessments_on_index() -> None:
+    response = ClaudeClient(FakeBackend()).build_response(_anomalies())
+
+    assert list(response.index) == [7, 3, 9]
+    assert response.loc[7, "risk_level"] == "high"
+    assert _ASSESSMENT_KEYS <= set(response.columns)
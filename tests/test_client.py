@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pytest
+import requests
+
+from api.dataset import AnomalyDetectorConn, AsyncAnomalyDetectorConn
+
+_FEATURES = [{"type": "Feature", "properties": {"name": "Odd Kiosk"}, "geometry": None}]
+
+
+def _collection() -> bytes:
+    return json.dumps({"type": "FeatureCollection", "features": _FEATURES}).encode()
+
+
+def test_sync_client_retries_overload_responses() -> None:
+    attempts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            attempts.append(self.path)
+            if len(attempts) == 1:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/geo+json")
+            self.end_headers()
+            self.wfile.write(_collection())
+
+        def log_message(self, *_) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with AnomalyDetectorConn(f"http://127.0.0.1:{server.server_port}", backoff=0, cache_dir=None) as conn:
+            assert conn.get_anomaly_data("Tulsa") == _FEATURES
+    finally:
+        server.shutdown()
+
+    assert len(attempts) == 2
+
+
+def test_unchanged_responses_are_revalidated_from_the_disk_cache(tmp_path) -> None:
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.headers.get("If-None-Match") == '"v1"':
+                statuses.append(304)
+                self.send_response(304)
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+                return
+            statuses.append(200)
+            body = _collection()
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with AnomalyDetectorConn(f"http://127.0.0.1:{server.server_port}", cache_dir=str(tmp_path)) as conn:
+            first = conn.get_anomaly_data("Tulsa")
+            second = conn.get_anomaly_data("Tulsa")
+    finally:
+        server.shutdown()
+
+    assert first == second == _FEATURES
+    assert statuses == [200, 304]
+
+
+def test_async_fan_out_is_bounded_and_retries() -> None:
+    in_flight = 0
+    peak = 0
+    failed_once = set()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        city = request.url.params["city"]
+        if city not in failed_once:
+            failed_once.add(city)
+            return httpx.Response(429, headers={"Retry-After": "0"})
+
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, content=_collection())
+
+    async def run():
+        async with AsyncAnomalyDetectorConn(transport=httpx.MockTransport(handler), backoff=0) as conn:
+            return await conn.get_anomaly_data_many([f"City {i}" for i in range(6)], limit=2)
+
+    results = asyncio.run(run())
+
+    assert list(results) == [f"City {i}" for i in range(6)]
+    assert all(features == _FEATURES for features in results.values())
+    assert peak <= 2
+
+
+def _serve(bodies: dict) -> HTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            media_type = "application/vnd.apache.arrow.stream" if "arrow" in self.headers.get("Accept", "") \
+                and "application/vnd.apache.arrow.stream" in bodies else "application/geo+json"
+            body = bodies[media_type]
+            self.send_response(200)
+            self.send_header("Content-Type", media_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_frames_are_decoded_from_arrow_and_fall_back_to_geojson(tmp_path) -> None:
+    from geopandas import GeoDataFrame
+    from shapely.geometry import Point
+
+    from server.api.responses import encode_frame, ARROW, GEOJSON
+
+    expected = GeoDataFrame({"name": ["Odd Kiosk", "Quiet Bench"], "anomaly_score": [-0.2, 0.1]},
+                            geometry=[Point(-95.99, 36.15), Point(-95.98, 36.16)], crs="EPSG:4326")
+    geojson = encode_frame(expected, GEOJSON)
+
+    for bodies in ({ARROW: encode_frame(expected, ARROW), GEOJSON: geojson}, {GEOJSON: geojson}):
+        server = _serve(bodies)
+        try:
+            for cache_dir in (None, str(tmp_path / str(len(bodies)))):
+                with AnomalyDetectorConn(f"http://127.0.0.1:{server.server_port}", cache_dir=cache_dir) as conn:
+                    frame = conn.get_anomaly_frame("Tulsa")
+
+                assert frame.crs == expected.crs
+                assert list(frame["name"]) == list(expected["name"])
+                assert list(frame["anomaly_score"]) == list(expected["anomaly_score"])
+                assert frame.geometry.geom_equals(expected.geometry).all()
+        finally:
+            server.shutdown()
+
+
+def test_exhausted_retries_raise_instead_of_returning_no_anomalies(tmp_path) -> None:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = b'{"detail": "Too many cold cities requested at once from this client"}'
+            self.send_response(429)
+            # Far longer than the client is willing to wait.
+            self.send_header("Retry-After", "3600")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for cache_dir in (None, str(tmp_path)):
+            with AnomalyDetectorConn(f"http://127.0.0.1:{server.server_port}", retries=1, cache_dir=cache_dir,
+                                     max_retry_after=0) as conn:
+                with pytest.raises(requests.HTTPError):
+                    conn.get_anomaly_data("Tulsa")
+                with pytest.raises(requests.HTTPError):
+                    conn.get_anomaly_data("Tulsa", deadline=10)
+    finally:
+        server.shutdown()
+
+    async def overloaded(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": "3600"})
+
+    async def run():
+        async with AsyncAnomalyDetectorConn(transport=httpx.MockTransport(overloaded), retries=1,
+                                            max_retry_after=0) as conn:
+            return await conn.get_anomaly_data_many(["A", "B"])
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
@@ -1,3 +1,5 @@
+import time
+
 import pytest
 
 from typing import Dict
@@ -8,6 +10,10 @@ _CITY = "Beaumont, CA, USA"
 _PLACE = "Calvary Chapel Beaumont"
 
 
+def test_pipeline_version_is_stable(anomaly_detector: AnomalyDetectorConn) -> None:
+    assert anomaly_detector.get_pipeline_version() == anomaly_detector.get_pipeline_version()
+
+
 def test_get_dataset(anomaly_detector: AnomalyDetectorConn) -> None:
     assert len(anomaly_detector.get_city_data(city=_CITY)) > 0
 
@@ -16,6 +22,26 @@ def test_get_place_of_interest(anomaly_detector: AnomalyDetectorConn) -> None:
     assert len(anomaly_detector.get_place_data(location=_PLACE, city=_CITY)) > 0
 
 
+def test_export_layer_filters_by_bbox(anomaly_detector: AnomalyDetectorConn) -> None:
+    bbox = (-116.99, 33.92, -116.97, 33.94)
+    features = list(anomaly_detector.iter_layer(_CITY, "amenities", bbox=bbox, columns=["name"], page_size=50))
+
+    assert len(features) > 0
+    assert all(set(feature["properties"]) == {"name"} for feature in features)
+
+
+def test_anomaly_job_reports_stages(anomaly_detector: AnomalyDetectorConn) -> None:
+    job = anomaly_detector.submit_anomaly_job(_CITY)
+
+    while job["status"] in ("queued", "running"):
+        time.sleep(2)
+        job = anomaly_detector.get_job(job["id"])
+
+    assert job["status"] == "done"
+    assert job["progress"] == 1
+    assert len(job["result"]["features"]) > 0
+
+
 class TestNearbyElements:
     @pytest.fixture(scope="class")
     def nearest_data(self, anomaly_detector: AnomalyDetectorConn) -> Dict:
@@ -34,3 +60,12 @@ class TestNearbyElements:
 
     def test_intersection_of_data(self, nearest_data: Dict) -> None:
         assert len(nearest_data['intersections']) == 0
+
+    def test_batch_matches_single_lookup(self, anomaly_detector: AnomalyDetectorConn, nearest_data: Dict) -> None:
+        found, missing = anomaly_detector.get_nearest_place_data_many(
+            places=[{"name": _PLACE}, {"name": "Not A Real Place"}], city=_CITY)
+
+        assert found['street']['name'] == nearest_data['street']['name']
+        assert found['location']['name'] == nearest_data['location']['name']
+        assert len(found['nearby']) == len(nearest_data['nearby'])
+        assert missing == {"error": "Location not found"}
@@ -0,0 +1,56 @@
+import json
+import time
+
+from geopandas import GeoDataFrame
+from shapely import Point
+
+from server.api import admission, anomaly_detection
+from server.api.city_cache import CITY_CACHE
+from server.api.deadline import Deadline, StageCosts, SKIPPED_LLM
+from server.api.responses import encode_frame, GEOJSON
+from tests.conftest import synthetic_features_and_graph
+
+
+def test_degradations_are_recorded_once_in_order() -> None:
+    deadline = Deadline(10)
+    deadline.degrade(SKIPPED_LLM)
+    deadline.degrade("fast_detector")
+    deadline.degrade(SKIPPED_LLM)
+
+    assert deadline.degradations == [SKIPPED_LLM, "fast_detector"]
+    assert 0 < deadline.remaining() <= 10
+
+
+def test_stage_costs_move_towards_observations() -> None:
+    costs = StageCosts({"llm": 8.0})
+    costs.record("llm", 2.0)
+
+    assert 2.0 < costs.estimate("llm") < 8.0
+    assert costs.estimate("llm", 2) == 2 * costs.estimate("llm")
+
+
+def test_geojson_foreign_members_are_spliced_into_the_collection() -> None:
+    frame = GeoDataFrame({"name": ["a"]}, geometry=[Point(0, 0)], crs="EPSG:4326")
+
+    collection = json.loads(encode_frame(frame, GEOJSON, {"degradations": [SKIPPED_LLM]}))
+
+    assert collection["degradations"] == [SKIPPED_LLM]
+    assert collection["type"] == "FeatureCollection"
+    assert len(collection["features"]) == 1
+
+
+def test_cold_city_beyond_the_deadline_is_built_for_a_retry(client, monkeypatch) -> None:
+    monkeypatch.setattr(admission, "boundary_area_km2", lambda key: 10.0)
+    monkeypatch.setattr(anomaly_detection, "get_location_data", lambda location: synthetic_features_and_graph())
+
+    rejected = client.get("/anomaly", params={"city": "Cold City", "deadline": 1})
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+    for _ in range(300):
+        if CITY_CACHE.contains("Cold City"):
+            break
+        time.sleep(0.05)
+    response = client.get("/anomaly", params={"city": "Cold City", "deadline": 30})
+    assert response.status_code == 200
+    assert response.headers["X-Degradations"] == "none"
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+_HEAVY_MODULES = ["osmnx", "geopandas", "sklearn", "anthropic", "shapely", "pyarrow"]
+
+
+def test_server_import_defers_heavy_modules() -> None:
+    # Run in a fresh interpreter, since other tests in this session may already have imported these.
+    snippet = (
+        "import sys, server.main; "
+        f"print([name for name in {_HEAVY_MODULES!r} if name in sys.modules])"
+    )
+    output = subprocess.run([sys.executable, "-c", snippet], check=True, capture_output=True, text=True)
+
+    assert output.stdout.strip() == "[]"
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from server.api import admission, jobs
+from server.api.admission import AdmissionController
+from server.api.anomaly_detection import CityData
+from server.api.jobs import Job, JobQueue, RUNNING, DONE, FAILED
+from server.api.shared_cache import SharedCityStore
+from tests.conftest import SYNTHETIC_CITY, synthetic_features_and_graph
+
+_PREVIEW = json.dumps({"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": None}]})
+
+
+def _finished_job(job_id: str, city: str, percent: float, nsmallest: int) -> str:
+    jobs._worker_progress.put((job_id, "assess", _PREVIEW))
+    time.sleep(0.5)
+    return json.dumps({"type": "FeatureCollection", "features": [], "city": city})
+
+
+def _crashing_job(job_id: str, city: str, percent: float, nsmallest: int) -> str:
+    jobs._worker_progress.put((job_id, None, None))
+    time.sleep(0.5)
+    os._exit(1)
+
+
+def _wait(queue: JobQueue, job_id: str, status: str, timeout: float = 60) -> Job:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job.status == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} is {queue.get(job_id).status}, expected {status}")
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1)
+    yield queue
+    queue.shutdown()
+
+
+def test_partial_results_are_exposed_until_the_job_finishes() -> None:
+    job = Job(id="a", city="Tulsa", status=RUNNING, stage="assess", partial=_PREVIEW)
+
+    running = job.to_dict()
+    assert running["partial"] == json.loads(_PREVIEW)
+    assert running["result"] is None
+
+    job.status = DONE
+    job.result = json.dumps({"type": "FeatureCollection", "features": []})
+    done = job.to_dict()
+    assert done["partial"] is None
+    assert done["result"]["features"] == []
+    assert done["progress"] == 1.0
+
+
+def test_job_reports_progress_then_result(queue, monkeypatch) -> None:
+    monkeypatch.setattr(jobs, "_run_anomaly_job", _finished_job)
+    job = queue.submit("Tulsa")
+
+    running = _wait(queue, job.id, RUNNING).to_dict()
+    assert running["stage"] == "assess"
+    assert running["partial"] == json.loads(_PREVIEW)
+
+    done = _wait(queue, job.id, DONE).to_dict()
+    assert done["result"]["city"] == "Tulsa"
+    assert done["progress"] == 1.0
+
+
+def test_dead_worker_fails_only_its_job_and_the_pool_recovers(queue, monkeypatch) -> None:
+    monkeypatch.setattr(jobs, "_run_anomaly_job", _crashing_job)
+    crashed = queue.submit("Crash")
+    _wait(queue, crashed.id, RUNNING)
+    # Queued behind the crashing job on the single worker, so it is lost with the pool but never started.
+    monkeypatch.setattr(jobs, "_run_anomaly_job", _finished_job)
+    queued = queue.submit("Queued")
+
+    failed = _wait(queue, crashed.id, FAILED)
+    assert "BrokenProcessPool" in failed.error
+    assert _wait(queue, queued.id, DONE).to_dict()["result"]["city"] == "Queued"
+    assert _wait(queue, queue.submit("After").id, DONE).to_dict()["result"]["city"] == "After"
+
+
+class _ColdCache:
+    def is_warm(self, city: str) -> bool:
+        return False
+
+    def peek(self, city: str):
+        return None
+
+
+def test_submissions_for_an_unfinished_city_share_one_job(queue, monkeypatch) -> None:
+    monkeypatch.setattr(jobs, "_run_anomaly_job", _finished_job)
+    job = queue.submit("Tulsa")
+
+    assert queue.submit(" tulsa ").id == job.id
+    assert queue.submit("Tulsa", nsmallest=10).id != job.id
+    _wait(queue, job.id, DONE)
+    assert queue.submit("Tulsa").id != job.id
+
+
+def test_jobs_hold_an_admission_ticket_until_they_finish(monkeypatch) -> None:
+    monkeypatch.setattr(jobs, "_run_anomaly_job", _finished_job)
+    monkeypatch.setattr(admission, "boundary_area_km2", lambda key: {"united states": 9.8e6}.get(key, 100.0))
+    controller = AdmissionController(_ColdCache(), max_area=5000, max_features=1000, budget=1000, default_area=300,
+                                     per_client=1, retry_after=12)
+    queue = JobQueue(max_workers=1, admission=controller)
+    try:
+        # Too large for a synchronous request, which is what jobs are for.
+        job = queue.submit("United States", client="client")
+        with pytest.raises(HTTPException) as rejected:
+            queue.submit("Tulsa", client="client")
+        assert rejected.value.status_code == 429
+
+        _wait(queue, job.id, DONE)
+        assert _wait(queue, queue.submit("Tulsa", client="client").id, DONE).city == "Tulsa"
+    finally:
+        queue.shutdown()
+
+
+def test_worker_loads_the_shared_snapshot_and_stores_its_assessments(tmp_path, monkeypatch) -> None:
+    store = SharedCityStore(str(tmp_path))
+    store.save("synthetic city", SYNTHETIC_CITY, CityData(*synthetic_features_and_graph()))
+    # Workers read their settings when spawned, so they share this store and never download the city.
+    monkeypatch.setenv("SHARED_CACHE_DIR", str(tmp_path))
+    queue = JobQueue(max_workers=1)
+    try:
+        result = _wait(queue, queue.submit(SYNTHETIC_CITY).id, DONE).to_dict()["result"]
+    finally:
+        queue.shutdown()
+
+    assessed = store.load("synthetic city").assessments[(0.05, 5)]
+    assert [feature["properties"]["name"] for feature in result["features"]] == list(assessed["name"])
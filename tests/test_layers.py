@@ -0,0 +1,65 @@
+import json
+
+import shapely.geometry
+from pyogrio import read_dataframe
+from shapely import box
+
+from tests.conftest import ORIGIN, SYNTHETIC_CITY
+
+
+def _features(response) -> list:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_layer_bbox_keeps_only_intersecting_features(client) -> None:
+    lon, lat = ORIGIN
+    bbox = (lon, lat, lon + 0.004, lat + 0.004)
+    everything = _features(client.get("/layers/amenities", params={"city": SYNTHETIC_CITY}))
+    inside = _features(client.get("/layers/amenities", params={"city": SYNTHETIC_CITY,
+                                                               "bbox": ",".join(map(str, bbox))}))
+
+    assert 0 < len(inside) < len(everything)
+    # Reprojection can move edges by a hair, so allow a small tolerance around the box.
+    area = box(*bbox).buffer(1e-6)
+    assert all(shapely.geometry.shape(feature["geometry"]).intersects(area) for feature in inside)
+    assert client.get("/layers/amenities", params={"city": SYNTHETIC_CITY, "bbox": "1,2,3"}).status_code == 400
+
+
+def test_layer_columns_limit_properties(client) -> None:
+    features = _features(client.get("/layers/amenities", params={"city": SYNTHETIC_CITY,
+                                                                 "columns": "name,Density"}))
+
+    assert features and all(set(feature["properties"]) == {"name", "Density"} for feature in features)
+    response = client.get("/layers/amenities", params={"city": SYNTHETIC_CITY, "columns": "name,missing"})
+    assert response.status_code == 400
+
+
+def test_layer_cursor_pages_through_every_feature(client) -> None:
+    everything = _features(client.get("/layers/amenities", params={"city": SYNTHETIC_CITY}))
+    names, cursor, pages = [], None, 0
+    while True:
+        params = {"city": SYNTHETIC_CITY, "limit": 15, "columns": "name"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/layers/amenities", params=params)
+        page = _features(response)
+        assert len(page) <= 15
+        names += [feature["properties"]["name"] for feature in page]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == -(-len(everything) // 15)
+    assert names == [feature["properties"]["name"] for feature in everything]
+
+
+def test_layer_fgb_page_matches_ndjson(client) -> None:
+    params = {"city": SYNTHETIC_CITY, "limit": 10}
+    ndjson = _features(client.get("/layers/amenities", params=params))
+    fgb = client.get("/layers/amenities", params={**params, "format": "fgb"})
+
+    assert fgb.headers["X-Next-Cursor"] == "10"
+    # FlatGeobuf orders features along its spatial index, so compare the page's contents rather than its order.
+    assert sorted(read_dataframe(fgb.content)["name"]) == sorted(feature["properties"]["name"] for feature in ndjson)
+    assert client.get("/layers/roads", params={"city": SYNTHETIC_CITY}).status_code == 404
@@ -0,0 +1,24 @@
+from server.api.metrics import METRICS, stage, track_request
+
+
+def test_stage_records_request_breakdown_and_histogram() -> None:
+    with track_request() as timings:
+        with stage("test_features") as timing:
+            timing.rows = 12
+        with stage("test_llm"):
+            pass
+
+    assert [t.name for t in timings.stages] == ["test_features", "test_llm"]
+    assert timings.server_timing().startswith("test_features;dur=")
+    assert 'desc="rows=12"' in timings.server_timing()
+
+    rendered = METRICS.render()
+    assert 'pipeline_stage_seconds_count{stage="test_features"} 1' in rendered
+    assert 'pipeline_stage_rows_total{stage="test_features"} 12' in rendered
+
+
+def test_stage_outside_request_only_updates_metrics() -> None:
+    with stage("test_background"):
+        pass
+
+    assert 'pipeline_stage_seconds_count{stage="test_background"} 1' in METRICS.render()
@@ -0,0 +1,42 @@
+from server.api.anomaly_detection import CityData
+
+from tests.conftest import SYNTHETIC_CITY, ORIGIN
+
+
+def test_batch_matches_places_and_reports_unmatched_ones(client) -> None:
+    lon, lat = ORIGIN
+    response = client.post("/nearest/batch", json={"city": SYNTHETIC_CITY, "places": [
+        {"name": "Place 3"}, {"lat": lat + 0.004, "lon": lon + 0.004}, {"name": "Nowhere"},
+        # Projects to inf in the city's UTM zone.
+        {"lat": 0, "lon": 0},
+    ]})
+
+    assert response.status_code == 200
+    place, point, unknown, far = response.json()
+    assert place["place"]["name"] == "Place 3" and place["street"]["name"].startswith("Street")
+    assert point["place"] is None and point["street"] is not None
+    assert unknown == far == {"error": "Location not found"}
+
+
+def test_batch_rejects_invalid_coordinates_and_radius(client) -> None:
+    invalid = [{"places": [{"lat": 91, "lon": 0}]}, {"places": [{"lat": 0, "lon": -181}]},
+               {"places": [{"name": "Place 3"}], "meters": 1e9}, {"places": [{"name": "Place 3"}], "meters": 0}]
+
+    for body in invalid:
+        assert client.post("/nearest/batch", json={"city": SYNTHETIC_CITY, **body}).status_code == 422
+
+
+def test_city_without_streets_yields_not_found_instead_of_failing(synthetic_city) -> None:
+    city = CityData.from_frames(synthetic_city.dataset, synthetic_city.street_edges.iloc[:0], synthetic_city.amenities,
+                                None, {}, snapshot="no-streets")
+
+    assert city.nearest_batch([{"name": "Place 3"}]) == [{"error": "Location not found"}]
+
+
+def test_single_nearest_goes_through_the_batch_path(client) -> None:
+    found = client.get("/nearest", params={"city": SYNTHETIC_CITY, "location": "Place 3"}).json()
+    missing = client.get("/nearest", params={"city": SYNTHETIC_CITY, "location": "Place 3", "loc_id": 2}).json()
+
+    assert found["place"]["name"] == "Place 3" and set(found) == {"place", "street", "location", "nearby",
+                                                                  "intersections"}
+    assert missing == {"error": "Location not found"}
@@ -0,0 +1,67 @@
+from server.api import admission
+from server.api.admission import AdmissionController
+from server.api.prewarm import RequestPopularity, PrewarmScheduler, POPULARITY
+
+
+class _RecordingCache:
+    def __init__(self) -> None:
+        self.refreshed = []
+
+    def refresh(self, city, prepare=lambda _: None, max_age=0) -> None:
+        self.refreshed.append(city)
+
+    def is_warm(self, city: str) -> bool:
+        return True
+
+    def peek(self, city: str):
+        return None
+
+
+def test_most_requested_ranks_normalized_cities() -> None:
+    popularity = RequestPopularity(window=60)
+    for city in ["Tulsa, Oklahoma", "tulsa,  oklahoma", "Austin, Texas", "Tulsa, Oklahoma", "Boise, Idaho"]:
+        popularity.record(city)
+
+    assert popularity.most_requested(2) == ["Tulsa, Oklahoma", "Austin, Texas"]
+
+
+def test_expired_requests_are_forgotten() -> None:
+    popularity = RequestPopularity(window=0)
+    popularity.record("Tulsa, Oklahoma")
+
+    assert popularity.most_requested(3) == []
+
+
+def test_run_once_refreshes_configured_and_popular_cities_once() -> None:
+    popularity = RequestPopularity(window=60)
+    popularity.record("austin, texas")
+    popularity.record("Boise, Idaho")
+    cache = _RecordingCache()
+
+    scheduler = PrewarmScheduler(cache, popularity, cities=["Austin, Texas"], top_n=2, concurrency=2)
+    scheduler.run_once()
+
+    assert sorted(cache.refreshed) == ["Austin, Texas", "Boise, Idaho"]
+
+
+def test_refreshes_skip_cities_admission_rejects(monkeypatch) -> None:
+    monkeypatch.setattr(admission, "boundary_area_km2", lambda key: {"united states": 9.8e6}.get(key, 100.0))
+    cache = _RecordingCache()
+    controller = AdmissionController(cache, max_area=5000, max_features=1000, budget=1000, default_area=300,
+                                     per_client=1, retry_after=12)
+
+    scheduler = PrewarmScheduler(cache, RequestPopularity(window=60), cities=["United States", "Boise, Idaho"],
+                                 top_n=0, concurrency=2, admission=controller)
+    scheduler.run_once()
+
+    # Warm or not, a refresh is a cold build and is held to the same size limits.
+    assert cache.refreshed == ["Boise, Idaho"]
+
+
+def test_rejected_requests_do_not_count_towards_popularity(client, monkeypatch) -> None:
+    monkeypatch.setattr(admission, "boundary_area_km2", lambda key: 9.8e6)
+
+    for _ in range(3):
+        assert client.get("/anomaly", params={"city": "United States"}).status_code == 422
+
+    assert "United States" not in POPULARITY.most_requested(100)
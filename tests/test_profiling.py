@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from server.api import settings
+from tests.conftest import SYNTHETIC_CITY
+
+_ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def profiling(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_admin_profile_writes_artifacts_and_serves_them(client, profiling) -> None:
+    response = client.get("/place", params={"city": SYNTHETIC_CITY, "location": "Place 0", "profile": 1},
+                          headers={**_ADMIN, "X-Request-ID": "place-profile"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Id"] == "place-profile"
+    assert os.path.exists(profiling / "place-profile.prof")
+
+    report = client.get("/profiles/place-profile", headers=_ADMIN)
+    assert report.status_code == 200 and "cumulative" in report.text
+    raw = client.get("/profiles/place-profile", params={"raw": 1}, headers=_ADMIN)
+    assert raw.content == (profiling / "place-profile.prof").read_bytes()
+
+
+def test_profiling_requires_admin_token(client, profiling) -> None:
+    response = client.get("/place", params={"city": SYNTHETIC_CITY, "location": "Place 0", "profile": 1},
+                          headers={"X-Admin-Token": "wrong", "X-Request-ID": "not-admin"})
+
+    assert "X-Profile-Id" not in response.headers
+    assert not os.listdir(profiling)
+    assert client.get("/profiles/not-admin").status_code == 403
+    assert client.get("/profiles/not-admin", headers=_ADMIN).status_code == 404
+    assert client.get("/profiles/..%2Fsecret", headers=_ADMIN).status_code == 404
+
+
+def test_profile_id_only_set_when_an_artifact_was_written(client, profiling) -> None:
+    # "/" does no profiled work, so there is nothing for the id to point at.
+    response = client.get("/", params={"profile": 1}, headers=_ADMIN)
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert not os.listdir(profiling)
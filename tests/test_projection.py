@@ -0,0 +1,36 @@
+import networkx as nx
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame
+from shapely import LineString, Point
+
+from server.api.projection import ProjectionContext
+
+
+def _city():
+    features = GeoDataFrame({"name": ["a", "b"]}, geometry=[Point(-95.99, 36.15), Point(-95.95, 36.17)],
+                            crs="EPSG:4326")
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    graph.add_node(1, x=-96.01, y=36.14)
+    graph.add_node(2, x=-95.93, y=36.18)
+    graph.add_edge(1, 2, key=0, geometry=LineString([(-96.01, 36.14), (-95.97, 36.16), (-95.93, 36.18)]))
+    return features, graph
+
+
+def test_every_layer_is_projected_into_one_utm_zone() -> None:
+    features, graph = _city()
+    context = ProjectionContext.for_city(features, graph)
+
+    projected = context.project_frame(features, "features")
+    expected = features.to_crs(features.estimate_utm_crs())
+    assert projected.crs == expected.crs == context.crs
+    assert np.allclose(shapely.get_coordinates(projected.geometry.values),
+                       shapely.get_coordinates(expected.geometry.values))
+
+    projected_graph = context.project_graph(graph)
+    assert projected_graph.graph["crs"] == context.crs
+    assert projected_graph.nodes[1]["x"] == context.project_lonlat(-96.01, 36.14).x
+    assert shapely.get_coordinates(projected_graph.edges[1, 2, 0]["geometry"])[0].tolist() == \
+        [projected_graph.nodes[1]["x"], projected_graph.nodes[1]["y"]]
+    # The source graph is left in WGS84.
+    assert graph.nodes[1]["x"] == -96.01
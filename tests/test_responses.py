@@ -0,0 +1,75 @@
+import numpy as np
+import shapely.geometry
+from geopandas import GeoDataFrame
+from pyogrio import read_dataframe
+from shapely import Point
+from starlette.requests import Request
+
+from api.frames import read_arrow
+from server.api.responses import frame_response, ARROW, FLATGEOBUF, GEOJSON
+from tests.conftest import SYNTHETIC_CITY
+
+
+def _request(**headers: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/anomaly", "query_string": b"",
+                    "headers": [(key.replace("_", "-").encode(), value.encode()) for key, value in headers.items()]})
+
+
+def _frame() -> GeoDataFrame:
+    return GeoDataFrame({"name": ["a"]}, geometry=[Point(0, 0)], crs="EPSG:4326")
+
+
+def test_versioned_response_is_revalidated_without_encoding() -> None:
+    etag = frame_response(_frame(), _request(), version="snapshot-1").headers["ETag"]
+
+    revalidated = frame_response(_frame(), _request(if_none_match=etag), version="snapshot-1")
+    changed = frame_response(_frame(), _request(if_none_match=etag), version="snapshot-2")
+
+    assert revalidated.status_code == 304 and revalidated.body == b""
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_etag_differs_per_negotiated_representation() -> None:
+    plain = frame_response(_frame(), _request(), version="snapshot-1").headers["ETag"]
+    gzipped = frame_response(_frame(), _request(accept_encoding="gzip"), version="snapshot-1").headers["ETag"]
+
+    assert plain != gzipped
+
+
+def test_uncacheable_responses_have_no_etag() -> None:
+    assert "ETag" not in frame_response(_frame(), _request(), cacheable=False).headers
+
+
+def test_anomaly_formats_are_negotiated_from_accept_or_format(client) -> None:
+    params = {"city": SYNTHETIC_CITY}
+    geojson = client.get("/anomaly", params=params)
+    arrow = client.get("/anomaly", params=params, headers={"Accept": f"{ARROW}, {GEOJSON};q=0.9"})
+    fgb = client.get("/anomaly", params={**params, "format": "fgb"})
+
+    assert geojson.headers["content-type"] == GEOJSON
+    assert arrow.headers["content-type"] == ARROW
+    assert fgb.headers["content-type"] == FLATGEOBUF
+    names = [feature["properties"]["name"] for feature in geojson.json()["features"]]
+    assert list(read_arrow(arrow.content)["name"]) == names
+    assert sorted(read_dataframe(fgb.content)["name"]) == sorted(names)
+    assert client.get("/anomaly", params={**params, "format": "shapefile"}).status_code == 400
+
+
+def test_anomaly_precision_rounds_coordinates(client) -> None:
+    features = client.get("/anomaly", params={"city": SYNTHETIC_CITY, "precision": 3}).json()["features"]
+
+    # Footprints smaller than the grid are kept rather than dropped as empty.
+    coordinates = shapely.get_coordinates([shapely.geometry.shape(feature["geometry"]) for feature in features])
+    assert len(coordinates) >= len(features)
+    assert np.allclose(coordinates, np.round(coordinates, 3))
+    assert client.get("/anomaly", params={"city": SYNTHETIC_CITY, "precision": 16}).status_code == 422
+
+
+def test_anomaly_compression_prefers_brotli_then_gzip(client) -> None:
+    def encoding(accept_encoding: str):
+        response = client.get("/anomaly", params={"city": SYNTHETIC_CITY}, headers={"Accept-Encoding": accept_encoding})
+        return response.headers.get("content-encoding")
+
+    assert encoding("gzip, br") == "br"
+    assert encoding("gzip") == "gzip"
+    assert encoding("identity") is None
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+from geopandas import GeoDataFrame
+from shapely import Point
+
+from server.api.serialization import frame_records, row_record, serialize_relationships, dumps
+
+
+def _frame() -> GeoDataFrame:
+    return GeoDataFrame({
+        "name": ["Odd Kiosk", None],
+        "Density": np.array([3, 4], dtype=np.int64),
+        "Meters From Street": [12.5, np.nan],
+        "osmid": [[1, 2], 3],
+    }, geometry=[Point(1, 2), None])
+
+
+def test_frames_become_json_ready_records_column_by_column() -> None:
+    records = frame_records(_frame())
+
+    assert records[0] == {"name": "Odd Kiosk", "Density": 3, "Meters From Street": 12.5, "osmid": [1, 2],
+                          "geometry": {"type": "Point", "coordinates": [1.0, 2.0]}}
+    assert records[1]["name"] is None
+    assert records[1]["Meters From Street"] is None
+    assert records[1]["geometry"] is None
+    assert type(records[1]["Density"]) is int
+
+
+def test_single_rows_and_relationships_match_frame_records() -> None:
+    frame = _frame()
+
+    assert row_record(frame.iloc[0]) == frame_records(frame)[0]
+    relationships = serialize_relationships({"place": frame.iloc[0], "nearby": frame.iloc[1:], "distance": np.float64(2)})
+    assert json.loads(dumps(relationships)) == {"place": frame_records(frame)[0], "nearby": frame_records(frame)[1:],
+                                                "distance": 2.0}
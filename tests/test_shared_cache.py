@@ -0,0 +1,85 @@
+import os
+
+from geopandas import GeoDataFrame
+from shapely import Point
+
+from server.api import anomaly_detection, settings, shared_cache
+from server.api.anomaly_detection import CityData
+from server.api.city_cache import CityCache
+from server.api.shared_cache import SharedCityStore, get_shared_store, _to_table, _from_table
+from tests.conftest import synthetic_features_and_graph
+
+
+def test_claim_blocks_other_live_builders_until_release(tmp_path) -> None:
+    store = SharedCityStore(str(tmp_path))
+
+    assert store.claim("tulsa", "Tulsa")
+    with store._connect() as connection:
+        # Pretend the parent process (alive, not us) holds the claim.
+        connection.execute("UPDATE cities SET builder_pid = ? WHERE key = ?", (os.getppid(), "tulsa"))
+    assert not store.claim("tulsa", "Tulsa")
+
+    with store._connect() as connection:
+        connection.execute("UPDATE cities SET builder_pid = NULL WHERE key = ?", ("tulsa",))
+    assert store.claim("tulsa", "Tulsa")
+    assert store.load("tulsa") is None
+
+
+def test_mixed_object_columns_round_trip_through_arrow() -> None:
+    frame = GeoDataFrame({"osmid": [1, [2, 3], None], "name": ["a", None, "c"]},
+                         geometry=[Point(0, 0), Point(1, 1), Point(2, 2)], crs="EPSG:32611")
+
+    restored = _from_table(_to_table(frame))
+
+    assert restored["osmid"].tolist() == [1, [2, 3], None]
+    assert restored["name"].isna().tolist() == [False, True, False]
+    assert restored.crs == frame.crs
+
+
+def test_assessments_are_shared_with_the_snapshot(tmp_path, monkeypatch) -> None:
+    store = SharedCityStore(str(tmp_path))
+    city_data = CityData(*synthetic_features_and_graph())
+    store.save("synthetic", "Synthetic", city_data)
+    expected = city_data.ai_anomaly_response().to_json()
+    # Computed after the snapshot was saved, as on a first request or a prewarm refresh.
+    store.save_assessments("synthetic", city_data)
+
+    def no_llm():
+        raise AssertionError("the LLM must not be called for a stored assessment")
+
+    monkeypatch.setattr(anomaly_detection, "get_claude_client", no_llm)
+    loaded = store.load("synthetic")
+    assert loaded.ai_anomaly_response().to_json() == expected
+    assert loaded.assessment_version() == city_data.assessment_version()
+
+    # A different model's assessments belong to another pipeline version and are not reused.
+    monkeypatch.setattr(settings, "LLM_MODEL", "another-model")
+    assert store.load("synthetic").assessments == {}
+
+
+def test_failed_save_still_serves_and_caches_the_built_city(tmp_path, monkeypatch) -> None:
+    store = SharedCityStore(str(tmp_path))
+    cache = CityCache(store=store)
+    monkeypatch.setattr(anomaly_detection, "get_location_data", lambda location: synthetic_features_and_graph())
+
+    def full_disk(*args) -> None:
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(shared_cache, "_write_table", full_disk)
+    city_data = cache.get("Synthetic")
+
+    assert cache.peek("Synthetic") is city_data
+    assert store.load("synthetic") is None
+    # Neither a half-written snapshot nor a stale build claim is left behind.
+    assert store.claim("synthetic", "Synthetic")
+    assert [entry for entry in os.listdir(tmp_path) if not entry.startswith("index.sqlite")] == \
+        [store._digest("synthetic")]
+    assert os.listdir(tmp_path / store._digest("synthetic")) == []
+
+
+def test_unwritable_store_directory_falls_back_to_private_caching(tmp_path, monkeypatch) -> None:
+    blocked = tmp_path / "file"
+    blocked.write_text("not a directory")
+    monkeypatch.setattr(settings, "SHARED_CACHE_DIR", str(blocked / "cities"))
+
+    assert get_shared_store() is None
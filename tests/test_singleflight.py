@@ -0,0 +1,22 @@
+import asyncio
+import time
+
+from server.api.metrics import METRICS
+from server.api.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_computation() -> None:
+    flight = SingleFlight("test")
+    calls = []
+
+    def compute(city: str) -> str:
+        calls.append(city)
+        time.sleep(0.2)
+        return city.upper()
+
+    async def run():
+        return await asyncio.gather(*[flight.do("beaumont", compute, "beaumont") for _ in range(5)])
+
+    assert asyncio.run(run()) == ["BEAUMONT"] * 5
+    assert calls == ["beaumont"]
+    assert METRICS.value("singleflight_coalesced_requests_total", endpoint="test") == 4
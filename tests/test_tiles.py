@@ -0,0 +1,61 @@
+import math
+
+import mapbox_vector_tile
+import shapely.geometry
+
+from server.api.metrics import METRICS
+from server.api.tiles import TileCache, TILE_EXTENT
+from tests.conftest import ORIGIN, SYNTHETIC_CITY
+
+_ZOOM = 15
+# render_tile keeps 64 pixels of buffer around the tile, at 256 pixels per tile.
+_BUFFER = 64 * TILE_EXTENT / 256
+
+
+def _tile(lon: float, lat: float, z: int):
+    n = 2 ** z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return int((lon + 180) / 360 * n), int(y)
+
+
+def test_amenity_tile_carries_scores_and_is_clipped(synthetic_city) -> None:
+    # The synthetic city spans a few tiles at this zoom; render the one around its center.
+    x, y = _tile(ORIGIN[0] + 0.0045, ORIGIN[1] + 0.0045, _ZOOM)
+    decoded = mapbox_vector_tile.decode(TileCache().get(synthetic_city, "amenities", _ZOOM, x, y))
+
+    features = decoded["amenities"]["features"]
+    scores = synthetic_city.scored_amenities.set_index("name")["anomaly_score"]
+    assert 0 < len(features) < len(scores)
+    for feature in features:
+        properties = feature["properties"]
+        assert math.isclose(properties["anomaly_score"], scores[properties["name"]])
+        assert properties["is_anomaly"] in (True, False, 0, 1)
+        coordinates = shapely.get_coordinates(shapely.geometry.shape(feature["geometry"]))
+        assert ((coordinates >= -_BUFFER) & (coordinates <= TILE_EXTENT + _BUFFER)).all()
+
+
+def test_edge_tile_is_clipped_and_served_from_cache_on_repeat(synthetic_city) -> None:
+    # At this zoom a tile is narrower than a block, so every street crossing it has to be clipped.
+    cache = TileCache()
+    x, y = _tile(ORIGIN[0] + 0.0045, ORIGIN[1] + 0.0045, _ZOOM + 2)
+    hits = METRICS.value("tile_cache_hits_total")
+
+    first = cache.get(synthetic_city, "edges", _ZOOM + 2, x, y)
+    second = cache.get(synthetic_city, "edges", _ZOOM + 2, x, y)
+
+    assert first is second
+    assert METRICS.value("tile_cache_hits_total") == hits + 1
+    features = mapbox_vector_tile.decode(first)["edges"]["features"]
+    assert features and all(feature["properties"]["highway"] == "residential" for feature in features)
+    coordinates = shapely.get_coordinates([shapely.geometry.shape(feature["geometry"]) for feature in features])
+    assert ((coordinates >= -_BUFFER) & (coordinates <= TILE_EXTENT + _BUFFER)).all()
+
+
+def test_tile_route_rejects_unknown_layers_and_out_of_range_tiles(client) -> None:
+    x, y = _tile(*ORIGIN, _ZOOM)
+    response = client.get(f"/tiles/{SYNTHETIC_CITY}/amenities/{_ZOOM}/{x}/{y}.mvt")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    assert client.get(f"/tiles/{SYNTHETIC_CITY}/roads/{_ZOOM}/{x}/{y}.mvt").status_code == 404
+    assert client.get(f"/tiles/{SYNTHETIC_CITY}/amenities/1/2/0.mvt").status_code == 404
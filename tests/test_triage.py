@@ -0,0 +1,40 @@
+from geopandas import GeoDataFrame
+from shapely import Point
+
+from server.api.constants import DATA_HEADERS, ASSESSMENT_HEADERS, ANOMALY_HEADERS
+from server.api.triage import triage_anomalies, model_only_assessments, RULE_SOURCE, MODEL_SOURCE
+
+
+def _anomalies() -> GeoDataFrame:
+    return GeoDataFrame({
+        DATA_HEADERS[0]: ["Stacked Shop", "Remote Hut", "Downtown Cafe", "Odd Kiosk"],
+        DATA_HEADERS[1]: [30.0, 1500.0, 0.0, 180.0],
+        DATA_HEADERS[2]: [5.0, 2500.0, 8.0, 300.0],
+        DATA_HEADERS[3]: [6, 0, 25, 2],
+        DATA_HEADERS[4]: [3, 0, 0, 1],
+    }, geometry=[Point(x, x) for x in range(4)])
+
+
+def test_clear_cut_rows_get_rule_assessments() -> None:
+    decided, ambiguous = triage_anomalies(_anomalies())
+
+    assert list(decided[DATA_HEADERS[0]]) == ["Stacked Shop", "Remote Hut", "Downtown Cafe"]
+    assert list(decided[ASSESSMENT_HEADERS[0]]) == ["high", "high", "low"]
+    assert (decided[ASSESSMENT_HEADERS[3]] == RULE_SOURCE).all()
+    assert decided.loc[0, ASSESSMENT_HEADERS[1]].startswith("Point lies inside 3 ")
+
+
+def test_ambiguous_rows_are_forwarded_untouched() -> None:
+    _, ambiguous = triage_anomalies(_anomalies())
+
+    assert list(ambiguous[DATA_HEADERS[0]]) == ["Odd Kiosk"]
+    assert ASSESSMENT_HEADERS[0] not in ambiguous.columns
+
+
+def test_model_only_assessments_follow_the_anomaly_flag() -> None:
+    anomalies = _anomalies().assign(**{ANOMALY_HEADERS[2]: [1, 0, 1, 0]})
+
+    assessed = model_only_assessments(anomalies)
+
+    assert assessed[ASSESSMENT_HEADERS[0]].tolist() == ["medium", "low", "medium", "low"]
+    assert (assessed[ASSESSMENT_HEADERS[3]] == MODEL_SOURCE).all()
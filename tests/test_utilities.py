@@ -0,0 +1,59 @@
+import networkx as nx
+import shapely
+from geopandas import GeoDataFrame
+from shapely import LineString, MultiPolygon, Point, box
+
+from server.api.anomaly_detection import CityData
+from server.api.utilities import representative_points
+
+
+def test_representative_points_lie_on_every_geometry_type() -> None:
+    geometries = [Point(1, 1), box(0, 0, 2, 2), MultiPolygon([box(0, 0, 1, 1), box(5, 5, 6, 6)]),
+                  LineString([(0, 0), (4, 0)])]
+    points = representative_points(geometries)
+
+    assert points[0] is geometries[0]
+    assert shapely.get_type_id(points).tolist() == [0, 0, 0, 0]
+    assert shapely.intersects(points, geometries).all()
+
+
+def test_multipolygon_and_line_amenities_get_street_and_building_features() -> None:
+    lon, lat = -95.99, 36.15
+    features = GeoDataFrame({
+        "name": ["hall", "trail", None],
+        "building": [None, None, "yes"],
+    }, geometry=[
+        MultiPolygon([box(lon, lat, lon + 0.0002, lat + 0.0002), box(lon + 0.01, lat, lon + 0.0101, lat + 0.0001)]),
+        LineString([(lon, lat + 0.001), (lon + 0.001, lat + 0.001)]),
+        box(lon - 0.001, lat - 0.001, lon + 0.001, lat + 0.001),
+    ], crs="EPSG:4326")
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    graph.add_node(1, x=lon - 0.01, y=lat + 0.003)
+    graph.add_node(2, x=lon + 0.02, y=lat + 0.003)
+    graph.add_edge(1, 2, key=0, osmid=1, length=1.0)
+
+    city = CityData(features, graph)
+    amenities = city.amenities.set_index("name")
+
+    assert amenities["Meters From Street"].gt(0).all()
+    assert amenities.loc["hall", "Building Intersections"] == 1
+    assert amenities.loc["trail", "Building Intersections"] == 0
+    assert city.get_nearest_street(city.amenities.iloc[0]) is not None
+    assert shapely.intersects(city.amenity_points, city.amenities.geometry.values).all()
+
+
+def test_amenities_sharing_a_name_keep_one_row_each() -> None:
+    lon, lat = -95.99, 36.15
+    features = GeoDataFrame({"name": ["Cafe", "Cafe", "Bank"], "building": [None, None, None]},
+                            geometry=[Point(lon, lat), Point(lon + 0.01, lat + 0.005), Point(lon, lat + 0.01)], crs="EPSG:4326")
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+    graph.add_node(1, x=lon - 0.01, y=lat + 0.001)
+    graph.add_node(2, x=lon + 0.02, y=lat + 0.001)
+    graph.add_edge(1, 2, key=0, osmid=1, length=1.0)
+
+    city = CityData(features, graph)
+
+    assert city.amenities["name"].tolist() == ["Cafe", "Cafe", "Bank"]
+    assert len(city.amenity_points) == 3
+    # Each cafe measures its own distance to the street, rather than both rows getting both values.
+    assert city.amenities["Meters From Street"].nunique() == 3